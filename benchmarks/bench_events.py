@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Cost of building and writing uinput events: ctypes input_event structures
+# stamped one by one with gettimeofday, as libuinput did before, against
+# struct packing into the frame of UInputDevice (write_event and
+# commit_frame). Events are written to /dev/null
+import ctypes
+import os
+
+import benchutils
+
+import libuinput
+import uinputdefs
+
+EVENTS = 8
+FRAMES = 20000
+
+def getevent(typ, code, value):
+	# One ctypes event with its own time, as the glue built them
+	ev = uinputdefs.input_event()
+	ev.time = uinputdefs.gettimeofday()
+	ev.type = typ
+	ev.code = code
+	ev.value = value
+	return ev
+
+def main():
+	fd = os.open(os.devnull, os.O_WRONLY)
+	libuinput.open_uinput = lambda: fd
+	events = [(uinputdefs.EV_ABS, code, 100 + code) for code in range(EVENTS - 1)] + [(uinputdefs.EV_KEY, uinputdefs.BTN_A, 1)]
+	
+	# ctypes frame, copied in event by event and written from its address
+	cframe = (uinputdefs.input_event * libuinput.FRAME_EVENTS)()
+	evsize = ctypes.sizeof(uinputdefs.input_event)
+	def ctypesFrame():
+		n = 0
+		for typ, code, value in events:
+			cframe[n] = getevent(typ, code, value)
+			n += 1
+		cframe[n] = getevent(uinputdefs.EV_SYN, uinputdefs.SYN_REPORT, 0)
+		n += 1
+		os.write(fd, ctypes.string_at(ctypes.addressof(cframe), n * evsize))
+		
+	d = libuinput.UInputDevice()
+	d.state = libuinput.STATE_DEV_CREATED
+	d.begin_frame()
+	def structFrame():
+		write_event = d.write_event
+		for typ, code, value in events:
+			write_event(typ, code, value)
+		d.commit_frame()
+		d.begin_frame()
+		
+	def ctypesEvent():
+		cframe[0] = getevent(uinputdefs.EV_ABS, 0, 100)
+		
+	def structEvent():
+		d.frame_len = 0
+		d.write_event(uinputdefs.EV_ABS, 0, 100)
+	
+	# Writing a full frame from a copy or from a view of the bytearray
+	size = libuinput.FRAME_EVENTS * d.evsize
+	def writeCopy():
+		os.write(fd, d.frame[:size])
+		
+	def writeView():
+		os.write(fd, d.frameView[:size])
+	
+	print("one event     ctypes %.3f us  struct %.3f us" % (benchutils.bestTime(ctypesEvent, FRAMES), benchutils.bestTime(structEvent, FRAMES)))
+	print("%d events+SYN ctypes %.3f us  struct %.3f us" % (EVENTS, benchutils.bestTime(ctypesFrame, FRAMES), benchutils.bestTime(structFrame, FRAMES)))
+	print("%d byte write copy %.3f us  view %.3f us" % (size, benchutils.bestTime(writeCopy, FRAMES), benchutils.bestTime(writeView, FRAMES)))
+	d.state = libuinput.STATE_DEV_DESTROYED
+	os.close(fd)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Cost and effect of the axis filters (see compile_filters and
+# UInputWiimote.filter): time per filtered value, time per Pro Controller
+# report with every axis filtered, and events sent for sticks at rest with
+# sensor noise
+import random
+
+import benchutils
+
+import mapping
+import uinputdefs
+import wiimote_uinput_glue
+
+REPORTS = 2000
+NOISE = 24
+
+FILTERS = (
+	("none", mapping.FILTER_NONE, ()),
+	("ema", mapping.FILTER_EMA, (30,)),
+	("euro", mapping.FILTER_EURO, (10, 50)),
+	("median", mapping.FILTER_MEDIAN, ()),
+)
+
+class CountingUInputDevice(benchutils.NullUInputDevice):
+	def __init__(self):
+		self.events = 0
+		
+	def write_event(self, typ, code, value):
+		if typ == uinputdefs.EV_ABS:
+			self.events += 1
+
+def createFiltered(filterType, filterParams, uinputdev=None):
+	# Pro Controller with the example mapping, every axis filtered
+	profile = benchutils.readMapping()
+	for _map in profile.proMapping.mapping:
+		if isinstance(_map, mapping.AxisMapping):
+			_map.filterType = filterType
+			_map.filterParams = filterParams
+	return benchutils.createGlueDevice(wiimote_uinput_glue.PROFILE_PRO_CONTROLLER, profile.proMapping, benchutils.createProController(), uinputdev)
+
+def restingPayloads(count, seed=1):
+	# Centered sticks with noise, no button pressed
+	rnd = random.Random(seed)
+	payloads = []
+	for r in range(count):
+		p = bytearray()
+		for axis in range(4):
+			v = 0x800 + rnd.randint(-NOISE, NOISE)
+			p += bytearray([v & 0xff, v >> 8])
+		p += bytearray([0xff, 0xff, 0xff])
+		payloads.append(p)
+	return payloads
+
+def main():
+	rnd = random.Random(1)
+	values = [rnd.randint(-2000, 2000) for i in range(1000)]
+	random_reports = benchutils.randomPayloads(11, REPORTS)
+	resting = restingPayloads(REPORTS)
+	for name, filterType, filterParams in FILTERS:
+		w = createFiltered(filterType, filterParams)
+		if w.filters != None:
+			index = [i for i, f in enumerate(w.filters) if f != None][0]
+			def filterValues():
+				for v in values:
+					w.filter(index, v)
+			perValue = "%.3f us/value" % (benchutils.bestTime(filterValues, 20) / len(values))
+		else:
+			perValue = "-"
+		def handle():
+			for p in random_reports:
+				w.handler_ext(p)
+		perReport = benchutils.bestTime(handle, 1) / REPORTS
+		counter = CountingUInputDevice()
+		w = createFiltered(filterType, filterParams, counter)
+		for p in resting:
+			w.handler_ext(p)
+		print("%-6s %-16s %6.2f us/report  %5d ABS events at rest" % (name, perValue, perReport, counter.events))
+
+if __name__ == "__main__":
+	main()
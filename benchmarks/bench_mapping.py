@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Cost of sending mapped inputs: the compiled plan (compile_mapping and
+# UInputWiimote.send_input) against the mapping interpreted for every
+# input, as send_event did before the plan. Pro Controller with the xbox360
+# example mapping, events dropped
+import random
+
+import benchutils
+
+import uinputdefs
+import mapping
+import wiimote_uinput_glue
+
+REPORTS = 2000
+
+def interpretedSend(w, _map, value, isNaturalAxis, _abs=None):
+	# send_event before compile_mapping: the conversion is worked out from
+	# the Mapping on every call
+	if _map._type == uinputdefs.EV_ABS and not isNaturalAxis:
+		w.emit(_map._type, _map._code[0], 1 if value else -1)
+	elif _map._type == uinputdefs.EV_KEY and isNaturalAxis:
+		_sens = 30
+		if isinstance(_map, mapping.ButtonMapping) and _map.sensitivity != None:
+			_sens = _map.sensitivity
+		w.emit(_map._type, _map._code[0], 1 if value>_sens else 0)
+	elif isNaturalAxis:
+		if isinstance(_map, mapping.AxisMapping) and _abs != None:
+			if _map.isInverted:
+				value = -value
+			if _map.sourceScale != None and _map.sourceScale > 0 and _abs != None:
+				_max = _abs.max
+				_scalef = _max / float(_map.sourceScale)
+				value = int(_scalef*value)
+			if len(_map._code) >= 2 and value > 0:
+				w.emit(_map._type, _map._code[1], value-(_abs.max/2), _abs)
+				w.emit(_map._type, _map._code[0], _abs.min, _abs)
+				return
+			elif len(_map._code) >= 2 and value < 0:
+				w.emit(_map._type, _map._code[0], (-value)-(_abs.max/2), _abs)
+				w.emit(_map._type, _map._code[1], _abs.min, _abs)
+				return
+			elif len(_map._code) >= 2 and value == 0:
+				w.emit(_map._type, _map._code[0], _abs.min, _abs)
+				w.emit(_map._type, _map._code[1], _abs.min, _abs)
+				return
+		w.emit(_map._type, _map._code[0], value, _abs)
+	else:
+		w.emit(_map._type, _map._code[0], 1 if value else 0)
+
+def main():
+	profile = benchutils.readMapping()
+	w = benchutils.createGlueDevice(wiimote_uinput_glue.PROFILE_PRO_CONTROLLER, profile.proMapping, benchutils.createProController())
+	pd = w.mapping.description
+	
+	# One value per mapped input and report, within the range of the input
+	rnd = random.Random(1)
+	inputs = [index for index, _map in enumerate(w.mapping.mapping) if _map != None]
+	reports = []
+	for r in range(REPORTS):
+		values = []
+		for index in inputs:
+			if pd.axis[index]:
+				_max = pd.abs_params[index].max
+				values.append((index, rnd.randint(-_max, _max)))
+			else:
+				values.append((index, rnd.randrange(2)))
+		reports.append(values)
+	
+	# Dispatch only: emit drops the values
+	w.emit = lambda typ, code, value, _abs=None, button=False: None
+	
+	def plan():
+		send_input = w.send_input
+		for values in reports:
+			for index, v in values:
+				send_input(index, v)
+				
+	def interpreted():
+		for values in reports:
+			for index, v in values:
+				_map = w.mapping.mapping[index]
+				_abs = pd.abs_params[index] if pd.axis[index] else None
+				interpretedSend(w, _map, v, pd.axis[index], _abs)
+	
+	n = REPORTS * len(inputs)
+	print("%d mapped inputs, %d reports" % (len(inputs), REPORTS))
+	print("interpreted  %.3f us/input" % (benchutils.bestTime(interpreted, 1) / n))
+	print("plan         %.3f us/input" % (benchutils.bestTime(plan, 1) / n))
+	
+	# Whole reports through handler_ext, with the real emit
+	del w.emit
+	for label, payloads in (("unchanged", [bytearray([0, 8, 0, 8, 0, 8, 0, 8, 0xff, 0xff, 0xff])] * REPORTS), ("random", benchutils.randomPayloads(11, REPORTS))):
+		def handle():
+			for p in payloads:
+				w.handler_ext(p)
+		print("handler_ext  %.2f us/report (%s reports)" % (benchutils.bestTime(handle, 1) / REPORTS, label))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Shared setup of the benchmarks: the test helpers (source path, glue
+# device fed directly with report payloads), payloads and timing. Run the benchmarks from anywhere, e.g.
+# python benchmarks/bench_mapping.py
+import os
+import random
+import sys
+import timeit
+
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")
+if not TESTS in sys.path:
+	sys.path.insert(0, TESTS)
+
+# Source path, and the bluetooth stand-in when PyBluez is missing
+import wiitestutils
+
+import fileutils
+from wiitestutils import NullUInputDevice, createGlueDevice, createProController
+
+MAPPING = wiitestutils.EXAMPLE_MAPPING
+
+def readMapping(filePath=MAPPING):
+	return fileutils.readMappingFromFile(filePath)
+
+def randomPayloads(size, count, seed=1):
+	rnd = random.Random(seed)
+	return [bytearray([rnd.randrange(256) for i in range(size)]) for j in range(count)]
+
+def bestTime(func, number, repeat=5):
+	# Best time of a call to func in microseconds
+	return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
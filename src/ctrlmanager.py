@@ -51,6 +51,10 @@ def onDeviceDisconnected(device):
 	for l in eventListeners:
 		l.onDeviceDisconnected(device)
 
+def onDeviceIdleChanged(device, idle):
+	for l in eventListeners:
+		l.onDeviceIdleChanged(device, idle)
+
 def filter_devices(devices):
 	for d in devices[:]:
 		if not ("Nintendo RVL-CNT-01" in d[1] or "Nintendo RVL-WBC-01" in d[1]):
@@ -66,7 +70,7 @@ def scan_wiimotes(duration=5):
 def connectDevice(device, mapping):
 	led = acquireLedSlot()
 	try:
-		w = wiimote_uinput_glue.UInputWiimote(device[0], device[1], mapping, led=led, disconnectCallback=onDeviceDisconnected)
+		w = wiimote_uinput_glue.UInputWiimote(device[0], device[1], mapping, led=led, disconnectCallback=onDeviceDisconnected, idleCallback=onDeviceIdleChanged)
 	except:
 		logging.warning("Could not connect to device: "+repr(device[0])+" "+repr(device[1]))
 		releaseLedSlot(led)
@@ -76,6 +80,18 @@ def connectDevice(device, mapping):
 	for l in eventListeners:
 		l.onDeviceConnected(w)
 		
+def setChangeOnlyReports(enabled):
+	wiimote_uinput_glue.setChangeOnlyReports(enabled)
+	
+def setIdleTimeout(seconds):
+	wiimote_uinput_glue.setIdleTimeout(seconds)
+	
+def setEmitRate(hz):
+	wiimote_uinput_glue.setEmitRate(hz)
+	with deviceListLock:
+		for d in deviceList[:]:
+			d.updateEmitRate()
+		
 def disconnectDevices():
 	with deviceListLock:
 		for d in deviceList[:]:
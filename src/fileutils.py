@@ -21,7 +21,7 @@ import re
 import logging
 
 import uinputdefs
-from mapping import WiimoteDescription,NunchukDescription,ClassicControllerDescription, ProControllerDescription, MappingProfile, Mapping, ButtonMapping, AxisMapping
+from mapping import WiimoteDescription,NunchukDescription,ClassicControllerDescription, ProControllerDescription, MappingProfile, Mapping, ButtonMapping, AxisMapping, FILTER_NONE, FILTER_EMA, FILTER_EURO, FILTER_MEDIAN
 
 PrettyMappingNames = {
 	"XBOX360_A": "BTN_A",
@@ -200,6 +200,10 @@ def readMappingFromFile(filePath):
 		
 	sensP = re.compile('\^[0-9]+')
 	dzP = re.compile('%[0-9]+')
+	curveP = re.compile('@[0-9]+')
+	adzP = re.compile('\+[0-9]+')
+	filterP = re.compile('~(ema|euro|median)([0-9]+)?(/[0-9]+)?')
+	shakeP = re.compile('~shake([0-9]+)?(/[0-9]+)?')
 	mapP = re.compile('[a-z0-9_]+(,[a-z0-9_]+){0,1}')
 	
 	for l in content[:]:
@@ -224,6 +228,42 @@ def readMappingFromFile(filePath):
 			ddz = int(d.group()[1:])
 		if ddz < 0 or ddz > 100:
 			ddz = 0
+		# Response curve match
+		c = curveP.search(_map)
+		curve = 100
+		if c!=None:
+			curve = int(c.group()[1:])
+		if curve <= 0:
+			curve = 100
+		# Anti dead zone match
+		a = adzP.search(_map)
+		adz = 0
+		if a!=None:
+			adz = int(a.group()[1:])
+		if adz < 0 or adz >= 100:
+			adz = 0
+		# Filter match
+		f = filterP.search(_map)
+		ftype = FILTER_NONE
+		fparams = ()
+		if f!=None:
+			p0 = int(f.group(2)) if f.group(2) else 0
+			p1 = int(f.group(3)[1:]) if f.group(3) else 0
+			if f.group(1) == "ema":
+				ftype = FILTER_EMA
+				fparams = (p0 if p0 > 0 and p0 <= 100 else 50,)
+			elif f.group(1) == "euro":
+				ftype = FILTER_EURO
+				fparams = (p0 if p0 > 0 and p0 <= 100 else 10, p1 if f.group(3) else 20)
+			else:
+				ftype = FILTER_MEDIAN
+		# Shake detector match
+		sh = shakeP.search(_map)
+		release = 0
+		hold = 0
+		if sh!=None:
+			release = int(sh.group(1)) if sh.group(1) else 0
+			hold = int(sh.group(2)[1:]) if sh.group(2) else 0
 		# Inverted
 		inverted = "inverted" in _map.lower()
 		m = mapP.search(_map)
@@ -254,7 +294,9 @@ def readMappingFromFile(filePath):
 		if ignore:
 			continue
 		# "el" is the controller button/axis, "_maps" is the uinput mapped button/axis
-		# "ssen" = sensitivity, "ddz" = dead zone
+		# "ssen" = sensitivity, "ddz" = dead zone, "curve" = response curve,
+		# "adz" = anti dead zone, "ftype" and "fparams" = filter, "release"
+		# and "hold" = shake release threshold and minimum hold time
 		try:
 			checkTargetMapping(_maps)
 		except Exception:
@@ -263,9 +305,9 @@ def readMappingFromFile(filePath):
 		_mapinst = None
 		_sysmaps = parseTargetMap(_maps)
 		if "BTN_" in _maps[0] or "KEY_" in _maps[0]:
-			_mapinst = ButtonMapping(_sysmaps, sensitivity=ssen)
+			_mapinst = ButtonMapping(_sysmaps, sensitivity=ssen, release=release, hold=hold)
 		elif "ABS_" in _maps[0]:
-			_mapinst = AxisMapping(_sysmaps, sourceScale=ssen, deadZone=ddz, isInverted=inverted)
+			_mapinst = AxisMapping(_sysmaps, sourceScale=ssen, deadZone=ddz, isInverted=inverted, curve=curve, antiDeadZone=adz, filterType=ftype, filterParams=fparams)
 		else:
 			logging.warning("Invalid target mapping assignment: "+l)
 			continue
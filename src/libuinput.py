@@ -58,6 +58,9 @@ STATE_UINPUT = 1
 STATE_DEV_CREATED = 2
 STATE_DEV_DESTROYED = 3
 
+# Events buffered in a frame before it is written out (see begin_frame)
+FRAME_EVENTS = 64
+
 class UInputDevice(object):
 
 	"""
@@ -83,6 +86,14 @@ class UInputDevice(object):
 		self.useff = False
 		self.ff_effects = []
 		self.ff_callback = ff_callback
+		# Event frame: packed events are buffered here and written with a
+		# single write when the frame is committed
+		self.evsize = uinputdefs.INPUT_EVENT.size
+		self.frame = bytearray(FRAME_EVENTS * self.evsize)
+		# Written through a view so committing a frame doesn't copy it
+		self.frameView = memoryview(self.frame)
+		self.frame_len = 0
+		self.framing = False
 
 	def setup(self):
 		"""
@@ -175,19 +186,57 @@ class UInputDevice(object):
 		logging.debug("uinput::stop:Listen for uinput events (FF).")
 
 	def send_event(self, ev):
+		self.write_event(ev.type, ev.code, ev.value)
+		
+	def write_event(self, typ, code, value):
+		"""
+		Send an event. In a frame, its time is set when the frame is written
+		"""
 		if self.state != STATE_DEV_CREATED:
 			return
-		os.write(self._f, buffer(ev)[:])
+		if self.framing:
+			if self.frame_len >= FRAME_EVENTS - 1:
+				# Keep a slot for SYN_REPORT
+				self.write_frame(*uinputdefs.timestamp())
+			uinputdefs.INPUT_EVENT.pack_into(self.frame, self.frame_len * self.evsize, 0, 0, typ, code, value)
+			self.frame_len += 1
+			return
+		sec, usec = uinputdefs.timestamp()
+		os.write(self._f, uinputdefs.INPUT_EVENT.pack(sec, usec, typ, code, value))
+		
+	def begin_frame(self):
+		"""
+		Buffer the next events until commit_frame or send_sync
+		"""
+		self.framing = True
+		
+	def commit_frame(self, t=None):
+		"""
+		Write the buffered events and a SYN_REPORT with a single write. All
+		of them get the time t (a time.time() value, now by default)
+		"""
+		self.framing = False
+		if self.state != STATE_DEV_CREATED:
+			self.frame_len = 0
+			return
+		uinputdefs.INPUT_EVENT.pack_into(self.frame, self.frame_len * self.evsize, 0, 0, uinputdefs.EV_SYN, uinputdefs.SYN_REPORT, 0)
+		self.frame_len += 1
+		self.write_frame(*uinputdefs.timestamp(t))
+		
+	def write_frame(self, sec, usec):
+		size = self.frame_len * self.evsize
+		for offset in range(0, size, self.evsize):
+			uinputdefs.TIMEVAL.pack_into(self.frame, offset, sec, usec)
+		os.write(self._f, self.frameView[:size])
+		self.frame_len = 0
 		
 	def send_sync(self):
 		if self.state != STATE_DEV_CREATED:
 			return
-		ev = uinputdefs.input_event()
-		ev.time = uinputdefs.gettimeofday()
-		ev.type = uinputdefs.EV_SYN
-		ev.code = uinputdefs.SYN_REPORT
-		ev.value = 0
-		os.write(self._f, buffer(ev)[:])
+		if self.framing:
+			self.commit_frame()
+			return
+		self.write_event(uinputdefs.EV_SYN, uinputdefs.SYN_REPORT, 0)
 		
 	def get_ff_effect_by_id(self, _id):
 		for eff in self.ff_effects[:]:
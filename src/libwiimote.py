@@ -23,14 +23,148 @@ import select
 import time
 import sys
 import logging
-import array
+import os
+import fcntl
+import errno
+import socket
+import functools
+import collections
+import struct
 
-if sys.version_info < (3, 0):
-	import Queue as queue
-	socket_to_bytearray = lambda x: map(ord, x)
-else:
-	import queue
-	socket_to_bytearray = lambda x: x
+# memoryview items are str in python 2
+zero_copy = sys.version_info >= (3, 0)
+
+# Clock for intervals (python 2 has no monotonic clock)
+monotonic = getattr(time, 'monotonic', time.time)
+
+def open_wakeup_fd():
+	# eventfd when available (python >= 3.10), a non-blocking pipe otherwise.
+	# Returns a (read fd, write fd) pair
+	if hasattr(os, 'eventfd'):
+		fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+		return fd, fd
+	rfd, wfd = os.pipe()
+	for fd in (rfd, wfd):
+		fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+	return rfd, wfd
+
+def signal_wakeup_fd(wfd):
+	try:
+		# 8 bytes: eventfd counters are 64 bit
+		os.write(wfd, b'\x01\x00\x00\x00\x00\x00\x00\x00')
+	except OSError as e:
+		if e.errno != errno.EAGAIN:
+			raise
+
+def clear_wakeup_fd(rfd):
+	try:
+		os.read(rfd, 64)
+	except OSError as e:
+		if e.errno != errno.EAGAIN:
+			raise
+
+def close_wakeup_fd(rfd, wfd):
+	os.close(rfd)
+	if wfd != rfd:
+		os.close(wfd)
+
+def open_reader_socket(sock):
+	# PyBluez sockets lack recv_into. A stdlib socket on a dup of the same fd
+	# provides it where python was built with bluetooth support
+	if hasattr(sock, 'recv_into'):
+		return sock
+	try:
+		return socket.fromfd(sock.fileno(), socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
+	except (AttributeError, IOError, OSError):
+		return sock
+
+# Kernel receive timestamps of the data sockets: SO_TIMESTAMP, delivered as
+# SCM_TIMESTAMP ancillary data holding a struct timeval. Python does not
+# export the option, 29 is its Linux value
+SO_TIMESTAMP = getattr(socket, 'SO_TIMESTAMP', 29)
+RX_TIMEVAL = struct.Struct("@ll")
+
+def enable_rx_timestamps(sock):
+	# Needs recvmsg (python >= 3.3). Without it reports are timed when read
+	if not hasattr(sock, 'recvmsg_into') or not sys.platform.startswith('linux'):
+		return False
+	try:
+		sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 1)
+	except (IOError, OSError):
+		return False
+	return True
+	
+def rx_timestamp(ancdata):
+	# time.time() value of the SCM_TIMESTAMP in ancdata, or None
+	for level, typ, data in ancdata:
+		if level == socket.SOL_SOCKET and typ == SO_TIMESTAMP and len(data) >= RX_TIMEVAL.size:
+			sec, usec = RX_TIMEVAL.unpack_from(data)
+			return sec + usec/1000000.0
+	return None
+
+class WiiReportBuffer():
+	# Preallocated receive buffer. Reports are received in place and handed
+	# around as cached memoryviews, so the steady-state path copies nothing.
+	# Each slot holds one report
+	SIZE = 32
+	
+	def __init__(self, slots=2):
+		length = self.SIZE*slots
+		self.data = bytearray(length)
+		self.view = memoryview(self.data)
+		# views[start][stop] and id(view) -> (start, stop) for cached views
+		self.views = [[None]*(length+1) for i in range(length+1)]
+		self.bounds = {}
+		self.slots = [self.view[i*self.SIZE:(i+1)*self.SIZE] for i in range(slots)]
+		self.sock = None
+		self.recv_into = False
+		# Kernel receive time of the last received report, None if unknown
+		self.timestamps = False
+		self.rxtime = None
+		self.ancsize = 0
+		
+	def bind(self, sock):
+		self.sock = sock
+		self.recv_into = hasattr(sock, 'recv_into')
+		self.timestamps = enable_rx_timestamps(sock)
+		if self.timestamps:
+			self.ancsize = socket.CMSG_SPACE(RX_TIMEVAL.size)
+		
+	def slice(self, start, stop):
+		if not zero_copy:
+			return self.data[start:stop]
+		v = self.views[start][stop]
+		if v is None:
+			v = self.view[start:stop]
+			self.views[start][stop] = v
+			self.bounds[id(v)] = (start, stop)
+		return v
+		
+	def sub(self, x, offset):
+		# x[offset:], without allocating when x is a view of this buffer
+		b = self.bounds.get(id(x))
+		if b is None:
+			return x[offset:]
+		start, stop = b
+		return self.slice(min(start+offset, stop), stop)
+		
+	def recv(self, slot=0, flags=0):
+		base = slot*self.SIZE
+		if self.timestamps:
+			n, ancdata, msg_flags, address = self.sock.recvmsg_into([self.slots[slot]], self.ancsize, flags)
+			self.rxtime = rx_timestamp(ancdata)
+		elif self.recv_into:
+			n = self.sock.recv_into(self.slots[slot], self.SIZE, flags)
+		else:
+			ev = self.sock.recv(self.SIZE, flags)
+			n = len(ev)
+			self.data[base:base+n] = ev
+		return self.slice(base, base+n)
+
+def mem_address(address):
+	# Memory offsets are always sent as 3 bytes (i2bs drops leading zeros,
+	# which breaks low EEPROM addresses)
+	return [(address >> 16) & 0xff, (address >> 8) & 0xff, address & 0xff]
 
 def i2bs(val):
 	lst = []
@@ -66,9 +200,12 @@ class WiiProtoReqs:
 	WIIPROTO_REQ_LED = 0x11
 	WIIPROTO_REQ_DRM = 0x12
 	WIIPROTO_REQ_IR1 = 0x13
+	WIIPROTO_REQ_SPEAKER = 0x14
 	WIIPROTO_REQ_SREQ = 0x15
 	WIIPROTO_REQ_WMEM = 0x16
 	WIIPROTO_REQ_RMEM = 0x17
+	WIIPROTO_REQ_SPEAKER_DATA = 0x18
+	WIIPROTO_REQ_SPEAKER_MUTE = 0x19
 	WIIPROTO_REQ_IR2 = 0x1a
 	WIIPROTO_REQ_STATUS = 0x20
 	WIIPROTO_REQ_DATA = 0x21
@@ -107,6 +244,15 @@ class WiiProtoReqs:
 	# DRM_SKAI2: BB*2 AA*1 II*18 
 	WIIPROTO_REQ_DRM_SKAI2 = 0x3f
 
+# Reports carrying a full input state snapshot. Only the newest one per device
+# is worth processing when the host has fallen behind
+CONTINUOUS_REPORTS = frozenset([
+	WiiProtoReqs.WIIPROTO_REQ_DRM_K,
+	WiiProtoReqs.WIIPROTO_REQ_DRM_KA,
+	WiiProtoReqs.WIIPROTO_REQ_DRM_KAE,
+	WiiProtoReqs.WIIPROTO_REQ_DRM_KEE
+])
+
 class WiiDevType:
 	WIIMOTE_DEV_UNKNOWN = 0
 	WIIMOTE_DEV_GENERIC = 1
@@ -132,17 +278,19 @@ class WiiMPMode:
 	WIIMOTE_MP_PASSTHROUGH_CLASSIC = 4
 	
 class WiiDeviceState:
-	send_command = threading.RLock()
-	command_ready = threading.Condition()
-	cmd_type = WiiProtoReqs.WIIPROTO_REQ_NULL
-	cmd_buffer = []
-	cmd_error = 0
-	cmd_battery = 0xff
-	flags = 0x0000
-	device = WiiDevType.WIIMOTE_DEV_UNKNOWN
-	extension = WiiDevExtension.WIIMOTE_EXT_NONE
-	lastpoll = 0
-	calib_pro_sticks = [0, 0, 0, 0]
+	def __init__(self):
+		# Command state is per device: commands to one remote never wait on
+		# another one
+		self.send_command = threading.RLock()
+		self.command_ready = threading.Condition()
+		self.cmd_type = WiiProtoReqs.WIIPROTO_REQ_NULL
+		self.cmd_buffer = []
+		self.cmd_error = 0
+		self.cmd_battery = 0xff
+		self.flags = 0x0000
+		self.device = WiiDevType.WIIMOTE_DEV_UNKNOWN
+		self.extension = WiiDevExtension.WIIMOTE_EXT_NONE
+		self.calib_pro_sticks = [0, 0, 0, 0]
 
 def getDeviceName(device):
 	name = ""
@@ -186,6 +334,12 @@ class WiiDataParser():
 		
 	@staticmethod
 	def parseWiimoteAccel(device, accel):
+		if device.state.device == WiiDevType.WIIMOTE_DEV_GEN10:
+			return WiiDataParser.parseWiimoteAccelGen10(device, accel)
+		return WiiDataParser.parseWiimoteAccelGen20(device, accel)
+		
+	@staticmethod
+	def parseWiimoteAccelGen10(device, accel):
 		x = accel[2] << 2
 		y = accel[3] << 2
 		z = accel[4] << 2
@@ -194,16 +348,20 @@ class WiiDataParser():
 		y |= (accel[1] >> 4) & 0x2
 		z |= (accel[1] >> 5) & 0x2
 		
-		if device.state.device == WiiDevType.WIIMOTE_DEV_GEN10:
-			x -= 0x1e7
-			y -= 0x1e7
-			z -= 0x1e7
-		else:
-			x -= 0x200
-			y -= 0x200
-			z -= 0x200
+		return x - 0x1e7, y - 0x1e7, z - 0x1e7
 		
-		return x, y, z
+	# Any device but the original Wiimote
+	@staticmethod
+	def parseWiimoteAccelGen20(device, accel):
+		x = accel[2] << 2
+		y = accel[3] << 2
+		z = accel[4] << 2
+	
+		x |= (accel[0] >> 5) & 0x3
+		y |= (accel[1] >> 4) & 0x2
+		z |= (accel[1] >> 5) & 0x2
+		
+		return x - 0x200, y - 0x200, z - 0x200
 		
 	#   Byte |   8    7 |  6    5 |  4    3 |  2 |  1  |
 	#   -----+----------+---------+---------+----+-----+
@@ -235,43 +393,44 @@ class WiiDataParser():
 	# values it 512 / 0x200
 	@staticmethod
 	def parseNunchuk(device, ext):
+		if device.state.flags & WiiProtoState.FLAG_MP_ACTIVE:
+			return WiiDataParser.parseNunchukMP(device, ext)
+		return WiiDataParser.parseNunchukNoMP(device, ext)
+		
+	@staticmethod
+	def parseNunchukNoMP(device, ext):
 		# X/Y axis
-		bx = ext[0]
-		by = ext[1]
-		bx -= 128
-		by -= 128
-		by = -by
+		bx = ext[0] - 128
+		by = 128 - ext[1]
 		
 		# Accelerometer
-		x = ext[2] << 2
-		y = ext[3] << 2
-		z = ext[4] << 2
+		x = (ext[2] << 2) | ((ext[5] >> 2) & 0x03)
+		y = (ext[3] << 2) | ((ext[5] >> 4) & 0x03)
+		z = (ext[4] << 2) | ((ext[5] >> 6) & 0x03)
 		
-		if device.state.flags & WiiProtoState.FLAG_MP_ACTIVE:
-			x |= (ext[5] >> 3) & 0x02
-			y |= (ext[5] >> 4) & 0x02
-			z &= ~0x4
-			z |= (ext[5] >> 5) & 0x06
-		else:
-			x |= (ext[5] >> 2) & 0x03
-			y |= (ext[5] >> 4) & 0x03
-			z |= (ext[5] >> 6) & 0x03
+		# Buttons
+		btn_z = not (ext[5] & 0x01)
+		btn_c = not (ext[5] & 0x02)
+			
+		return bx, by, x - 0x200, y - 0x200, z - 0x200, btn_c, btn_z
 		
-		x -= 0x200
-		y -= 0x200
-		z -= 0x200
+	# Interleaved with Motion Plus
+	@staticmethod
+	def parseNunchukMP(device, ext):
+		# X/Y axis
+		bx = ext[0] - 128
+		by = 128 - ext[1]
+		
+		# Accelerometer
+		x = (ext[2] << 2) | ((ext[5] >> 3) & 0x02)
+		y = (ext[3] << 2) | ((ext[5] >> 4) & 0x02)
+		z = ((ext[4] << 2) & ~0x4) | ((ext[5] >> 5) & 0x06)
 		
 		# Buttons
-		btn_z = False
-		btn_c = False
-		if device.state.flags & WiiProtoState.FLAG_MP_ACTIVE:
-			btn_z = not (ext[5] & 0x04)
-			btn_c = not (ext[5] & 0x08)
-		else:
-			btn_z = not (ext[5] & 0x01)
-			btn_c = not (ext[5] & 0x02)
+		btn_z = not (ext[5] & 0x04)
+		btn_c = not (ext[5] & 0x08)
 			
-		return bx, by, x, y, z, btn_c, btn_z
+		return bx, by, x - 0x200, y - 0x200, z - 0x200, btn_c, btn_z
 		
 	#   Byte |  8  |  7  |  6  |  5  |  4  |  3  |  2  |  1  |
 	#   -----+-----+-----+-----+-----+-----+-----+-----+-----+
@@ -316,38 +475,40 @@ class WiiDataParser():
 	# is the same as before.
 	@staticmethod
 	def parseClassic(device, ext):
-		mp = device.state.flags & WiiProtoState.FLAG_MP_ACTIVE
-		rx = 0; ry = 0; lx = 0; ly = 0; lt = 0; rt = 0
+		if device.state.flags & WiiProtoState.FLAG_MP_ACTIVE:
+			return WiiDataParser.parseClassicMP(device, ext)
+		return WiiDataParser.parseClassicNoMP(device, ext)
 		
-		if mp:
-			lx = ext[0] & 0x3e
-			ly = ext[1] & 0x3e
-		else:
-			lx = ext[0] & 0x3f
-			ly = ext[1] & 0x3f
+	@staticmethod
+	def parseClassicNoMP(device, ext):
+		lx = (ext[0] & 0x3f) - 0x20
+		ly = 0x20 - (ext[1] & 0x3f)
+		rx, ry, lt, rt = WiiDataParser.parseClassicRightAxes(ext)
+		
+		btn_right = not (ext[4] & 0x80)
+		btn_down = not (ext[4] & 0x40)
+		btn_lt = not (ext[4] & 0x20)
+		btn_minus = not (ext[4] & 0x10)
+		btn_home = not (ext[4] & 0x08)
+		btn_plus = not (ext[4] & 0x04)
+		btn_rt = not (ext[4] & 0x02)
+		btn_zl = not (ext[5] & 0x80)
+		btn_b = not (ext[5] & 0x40)
+		btn_y = not (ext[5] & 0x20)
+		btn_a = not (ext[5] & 0x10)
+		btn_x = not (ext[5] & 0x08)
+		btn_zr = not (ext[5] & 0x04)
+		btn_left = not (ext[5] & 0x02)
+		btn_up = not (ext[5] & 0x01)
 			
-		rx = (ext[0] >> 3) & 0x18
-		rx |= (ext[1] >> 5) & 0x06
-		rx |= (ext[2] >> 7) & 0x01
-		ry = ext[2] & 0x1f
-	
-		rt = ext[3] & 0x1f
-		lt = (ext[2] >> 2) & 0x18
-		lt |= (ext[3] >> 5) & 0x07
-	
-		rx <<= 1
-		ry <<= 1
-		rt <<= 1
-		lt <<= 1
-		
-		rx -= 0x20
-		lx -= 0x20
-		ry -= 0x20
-		ly -= 0x20
-		ly = -ly
-		ry = -ry
-		lt = lt - 30
-		rt = rt - 30
+		return lx, ly, rx, ry, lt, rt, btn_left, btn_right, btn_up, btn_down, btn_minus, btn_home, btn_plus, btn_a, btn_b, btn_x, btn_y, btn_lt, btn_rt, btn_zl, btn_zr
+		
+	# Interleaved with Motion Plus
+	@staticmethod
+	def parseClassicMP(device, ext):
+		lx = (ext[0] & 0x3e) - 0x20
+		ly = 0x20 - (ext[1] & 0x3e)
+		rx, ry, lt, rt = WiiDataParser.parseClassicRightAxes(ext)
 		
 		btn_right = not (ext[4] & 0x80)
 		btn_down = not (ext[4] & 0x40)
@@ -362,16 +523,19 @@ class WiiDataParser():
 		btn_a = not (ext[5] & 0x10)
 		btn_x = not (ext[5] & 0x08)
 		btn_zr = not (ext[5] & 0x04)
-		btn_up = False
-		btn_left = False
-		if mp:
-			btn_left = not (ext[1] & 0x01)
-			btn_up = not (ext[0] & 0x01)
-		else:
-			btn_left = not (ext[5] & 0x02)
-			btn_up = not (ext[5] & 0x01)
+		btn_left = not (ext[1] & 0x01)
+		btn_up = not (ext[0] & 0x01)
 			
 		return lx, ly, rx, ry, lt, rt, btn_left, btn_right, btn_up, btn_down, btn_minus, btn_home, btn_plus, btn_a, btn_b, btn_x, btn_y, btn_lt, btn_rt, btn_zl, btn_zr
+		
+	# RX, RY, LT and RT are laid out the same with and without Motion Plus
+	@staticmethod
+	def parseClassicRightAxes(ext):
+		rx = ((ext[0] >> 3) & 0x18) | ((ext[1] >> 5) & 0x06) | ((ext[2] >> 7) & 0x01)
+		ry = ext[2] & 0x1f
+		rt = ext[3] & 0x1f
+		lt = ((ext[2] >> 2) & 0x18) | ((ext[3] >> 5) & 0x07)
+		return (rx << 1) - 0x20, 0x20 - (ry << 1), (lt << 1) - 30, (rt << 1) - 30
 	
 	#   Byte |  8  |  7  |  6  |  5  |  4  |  3  |  2  |  1  |
 	#   -----+-----+-----+-----+-----+-----+-----+-----+-----+
@@ -414,6 +578,32 @@ class WiiDataParser():
 	#   BATTERY: battery capacity from 000 (empty) to 100 (full)
 	@staticmethod
 	def parseProController(device, ext):
+		lx, ly, rx, ry = WiiDataParser.parseProControllerSticks(device, ext)
+		
+		btn_right = not (ext[8] & 0x80)
+		btn_down = not (ext[8] & 0x40)
+		btn_tl = not (ext[8] & 0x20)
+		btn_minus = not (ext[8] & 0x10)
+		btn_home = not (ext[8] & 0x08)
+		btn_plus = not (ext[8] & 0x04)
+		btn_tr = not (ext[8] & 0x02)
+		
+		btn_zl = not (ext[9] & 0x80)
+		btn_b = not (ext[9] & 0x40)
+		btn_y = not (ext[9] & 0x20)
+		btn_a = not (ext[9] & 0x10)
+		btn_x = not (ext[9] & 0x08)
+		btn_zr = not (ext[9] & 0x04)
+		btn_left = not (ext[9] & 0x02)
+		btn_up = not (ext[9] & 0x01)
+		
+		btn_thumbl = not (ext[10] & 0x02)
+		btn_thumbr = not (ext[10] & 0x01)
+		
+		return lx, ly, rx, ry, btn_left, btn_right, btn_up, btn_down, btn_minus, btn_home, btn_plus, btn_a, btn_b, btn_x, btn_y, btn_tl, btn_tr, btn_zl, btn_zr, btn_thumbl, btn_thumbr
+		
+	@staticmethod
+	def parseProControllerSticks(device, ext):
 		lx = (ext[0] & 0xff) | ((ext[1] & 0x0f) << 8)
 		rx = (ext[2] & 0xff) | ((ext[3] & 0x0f) << 8)
 		ly = (ext[4] & 0xff) | ((ext[5] & 0x0f) << 8)
@@ -448,157 +638,692 @@ class WiiDataParser():
 		rx += device.state.calib_pro_sticks[2]
 		ry += device.state.calib_pro_sticks[3]
 		
-		btn_right = not (ext[8] & 0x80)
-		btn_down = not (ext[8] & 0x40)
-		btn_tl = not (ext[8] & 0x20)
-		btn_minus = not (ext[8] & 0x10)
-		btn_home = not (ext[8] & 0x08)
-		btn_plus = not (ext[8] & 0x04)
-		btn_tr = not (ext[8] & 0x02)
+		return lx, ly, rx, ry
 		
-		btn_zl = not (ext[9] & 0x80)
-		btn_b = not (ext[9] & 0x40)
-		btn_y = not (ext[9] & 0x20)
-		btn_a = not (ext[9] & 0x10)
-		btn_x = not (ext[9] & 0x08)
-		btn_zr = not (ext[9] & 0x04)
-		btn_left = not (ext[9] & 0x02)
-		btn_up = not (ext[9] & 0x01)
+	# Bitmask variants of the parsers above. Buttons are returned as a single
+	# int laid out as described in WiiButtonBits; axes are unchanged
+	@staticmethod
+	def parseWiimoteKeyMask(device, payload):
+		return WII_KEYS_LUT0[payload[0]] | WII_KEYS_LUT1[payload[1]]
 		
-		btn_thumbl = not (ext[10] & 0x02)
-		btn_thumbr = not (ext[10] & 0x01)
+	@staticmethod
+	def parseNunchukMask(device, ext):
+		if device.state.flags & WiiProtoState.FLAG_MP_ACTIVE:
+			return WiiDataParser.parseNunchukMaskMP(device, ext)
+		return WiiDataParser.parseNunchukMaskNoMP(device, ext)
 		
-		return lx, ly, rx, ry, btn_left, btn_right, btn_up, btn_down, btn_minus, btn_home, btn_plus, btn_a, btn_b, btn_x, btn_y, btn_tl, btn_tr, btn_zl, btn_zr, btn_thumbl, btn_thumbr
+	@staticmethod
+	def parseNunchukMaskNoMP(device, ext):
+		x = (ext[2] << 2) | ((ext[5] >> 2) & 0x03)
+		y = (ext[3] << 2) | ((ext[5] >> 4) & 0x03)
+		z = (ext[4] << 2) | ((ext[5] >> 6) & 0x03)
+		return ext[0] - 128, 128 - ext[1], x - 0x200, y - 0x200, z - 0x200, NUNCHUK_LUT[ext[5]]
+		
+	@staticmethod
+	def parseNunchukMaskMP(device, ext):
+		x = (ext[2] << 2) | ((ext[5] >> 3) & 0x02)
+		y = (ext[3] << 2) | ((ext[5] >> 4) & 0x02)
+		z = ((ext[4] << 2) & ~0x4) | ((ext[5] >> 5) & 0x06)
+		return ext[0] - 128, 128 - ext[1], x - 0x200, y - 0x200, z - 0x200, NUNCHUK_MP_LUT[ext[5]]
 		
+	@staticmethod
+	def parseClassicMask(device, ext):
+		if device.state.flags & WiiProtoState.FLAG_MP_ACTIVE:
+			return WiiDataParser.parseClassicMaskMP(device, ext)
+		return WiiDataParser.parseClassicMaskNoMP(device, ext)
+		
+	@staticmethod
+	def parseClassicMaskNoMP(device, ext):
+		rx, ry, lt, rt = WiiDataParser.parseClassicRightAxes(ext)
+		buttons = CLASSIC_LUT4[ext[4]] | CLASSIC_LUT5[ext[5]]
+		return (ext[0] & 0x3f) - 0x20, 0x20 - (ext[1] & 0x3f), rx, ry, lt, rt, buttons
+		
+	@staticmethod
+	def parseClassicMaskMP(device, ext):
+		rx, ry, lt, rt = WiiDataParser.parseClassicRightAxes(ext)
+		buttons = CLASSIC_LUT4[ext[4]] | CLASSIC_MP_LUT5[ext[5]] | CLASSIC_MP_LUT0[ext[0]] | CLASSIC_MP_LUT1[ext[1]]
+		return (ext[0] & 0x3e) - 0x20, 0x20 - (ext[1] & 0x3e), rx, ry, lt, rt, buttons
+		
+	@staticmethod
+	def parseProControllerMask(device, ext):
+		lx, ly, rx, ry = WiiDataParser.parseProControllerSticks(device, ext)
+		return lx, ly, rx, ry, PRO_LUT8[ext[8]] | PRO_LUT9[ext[9]] | PRO_LUT10[ext[10]]
+
+class WiiButtonBits:
+	# Bit positions of the button masks. They follow the indexes of the
+	# matching mapping.*Description so the glue can use them directly
+	WIIMOTE_A = 0
+	WIIMOTE_B = 1
+	WIIMOTE_1 = 2
+	WIIMOTE_2 = 3
+	WIIMOTE_MINUS = 4
+	WIIMOTE_HOME = 5
+	WIIMOTE_PLUS = 6
+	WIIMOTE_LEFT = 7
+	WIIMOTE_RIGHT = 8
+	WIIMOTE_UP = 9
+	WIIMOTE_DOWN = 10
+	
+	NUNCHUK_C = 15
+	NUNCHUK_Z = 16
+	
+	# Classic Controller and Pro Controller
+	CLASSIC_A = 0
+	CLASSIC_B = 1
+	CLASSIC_X = 2
+	CLASSIC_Y = 3
+	CLASSIC_MINUS = 4
+	CLASSIC_HOME = 5
+	CLASSIC_PLUS = 6
+	CLASSIC_LEFT = 7
+	CLASSIC_RIGHT = 8
+	CLASSIC_UP = 9
+	CLASSIC_DOWN = 10
+	CLASSIC_TL = 11
+	CLASSIC_TR = 12
+	CLASSIC_ZL = 13
+	CLASSIC_ZR = 14
+	PRO_THUMBL = 19
+	PRO_THUMBR = 20
+	
+	# All the bits each parser can set
+	WIIMOTE_MASK = 0x0007ff
+	NUNCHUK_MASK = 0x018000
+	CLASSIC_MASK = 0x007fff
+	PRO_MASK = 0x187fff
+
+def build_button_lut(bits, active_low=False):
+	# 256-entry table: raw byte -> button mask. bits is a list of
+	# (raw byte mask, WiiButtonBits position)
+	lut = []
+	for raw in range(256):
+		mask = 0
+		for rawmask, bit in bits:
+			if (not (raw & rawmask)) if active_low else (raw & rawmask):
+				mask |= 1 << bit
+		lut.append(mask)
+	return tuple(lut)
+
+WII_KEYS_LUT0 = build_button_lut([(0x01, WiiButtonBits.WIIMOTE_LEFT), (0x02, WiiButtonBits.WIIMOTE_RIGHT),
+	(0x04, WiiButtonBits.WIIMOTE_DOWN), (0x08, WiiButtonBits.WIIMOTE_UP), (0x10, WiiButtonBits.WIIMOTE_PLUS)])
+WII_KEYS_LUT1 = build_button_lut([(0x01, WiiButtonBits.WIIMOTE_2), (0x02, WiiButtonBits.WIIMOTE_1),
+	(0x04, WiiButtonBits.WIIMOTE_B), (0x08, WiiButtonBits.WIIMOTE_A), (0x10, WiiButtonBits.WIIMOTE_MINUS),
+	(0x80, WiiButtonBits.WIIMOTE_HOME)])
+NUNCHUK_LUT = build_button_lut([(0x01, WiiButtonBits.NUNCHUK_Z), (0x02, WiiButtonBits.NUNCHUK_C)], active_low=True)
+NUNCHUK_MP_LUT = build_button_lut([(0x04, WiiButtonBits.NUNCHUK_Z), (0x08, WiiButtonBits.NUNCHUK_C)], active_low=True)
+CLASSIC_LUT4 = build_button_lut([(0x80, WiiButtonBits.CLASSIC_RIGHT), (0x40, WiiButtonBits.CLASSIC_DOWN),
+	(0x20, WiiButtonBits.CLASSIC_TL), (0x10, WiiButtonBits.CLASSIC_MINUS), (0x08, WiiButtonBits.CLASSIC_HOME),
+	(0x04, WiiButtonBits.CLASSIC_PLUS), (0x02, WiiButtonBits.CLASSIC_TR)], active_low=True)
+CLASSIC_MP_LUT5 = build_button_lut([(0x80, WiiButtonBits.CLASSIC_ZL), (0x40, WiiButtonBits.CLASSIC_B),
+	(0x20, WiiButtonBits.CLASSIC_Y), (0x10, WiiButtonBits.CLASSIC_A), (0x08, WiiButtonBits.CLASSIC_X),
+	(0x04, WiiButtonBits.CLASSIC_ZR)], active_low=True)
+CLASSIC_LUT5 = tuple(m | CLASSIC_MP_LUT5[raw] for raw, m in enumerate(build_button_lut([(0x02, WiiButtonBits.CLASSIC_LEFT),
+	(0x01, WiiButtonBits.CLASSIC_UP)], active_low=True)))
+CLASSIC_MP_LUT0 = build_button_lut([(0x01, WiiButtonBits.CLASSIC_UP)], active_low=True)
+CLASSIC_MP_LUT1 = build_button_lut([(0x01, WiiButtonBits.CLASSIC_LEFT)], active_low=True)
+# Pro Controller ext[8] and ext[9] share the Classic Controller ext[4]/ext[5] layout
+PRO_LUT8 = CLASSIC_LUT4
+PRO_LUT9 = CLASSIC_LUT5
+PRO_LUT10 = build_button_lut([(0x02, WiiButtonBits.PRO_THUMBL), (0x01, WiiButtonBits.PRO_THUMBR)], active_low=True)
+		
+
+class WiiDecoders():
+	# Parsers specialized for the current device type, extension and Motion
+	# Plus state. Rebuilt by WiiDevice.updateDecoders whenever one of those
+	# changes, so the per-report path does not test them again
+	def __init__(self, device):
+		mp = device.state.flags & WiiProtoState.FLAG_MP_ACTIVE
+		extension = device.state.extension
+		
+		self.keys = functools.partial(WiiDataParser.parseWiimoteKeys, device)
+		self.keymask = functools.partial(WiiDataParser.parseWiimoteKeyMask, device)
+		if device.state.device == WiiDevType.WIIMOTE_DEV_GEN10:
+			self.accel = functools.partial(WiiDataParser.parseWiimoteAccelGen10, device)
+		else:
+			self.accel = functools.partial(WiiDataParser.parseWiimoteAccelGen20, device)
+			
+		self.ext = None
+		self.extmask = None
+		if extension == WiiDevExtension.WIIMOTE_EXT_NUNCHUK:
+			parser = WiiDataParser.parseNunchukMP if mp else WiiDataParser.parseNunchukNoMP
+			maskparser = WiiDataParser.parseNunchukMaskMP if mp else WiiDataParser.parseNunchukMaskNoMP
+		elif extension == WiiDevExtension.WIIMOTE_EXT_CLASSIC_CONTROLLER or extension == WiiDevExtension.WIIMOTE_EXT_CLASSIC_CONTROLLER_PRO:
+			parser = WiiDataParser.parseClassicMP if mp else WiiDataParser.parseClassicNoMP
+			maskparser = WiiDataParser.parseClassicMaskMP if mp else WiiDataParser.parseClassicMaskNoMP
+		elif extension == WiiDevExtension.WIIMOTE_EXT_PRO_CONTROLLER or device.state.device == WiiDevType.WIIMOTE_DEV_PRO_CONTROLLER:
+			parser = WiiDataParser.parseProController
+			maskparser = WiiDataParser.parseProControllerMask
+		else:
+			return
+		self.ext = functools.partial(parser, device)
+		self.extmask = functools.partial(maskparser, device)
+
+class WiiCmdPriority:
+	# Output report priority classes, highest first
+	FEEDBACK = 0
+	CONTROL = 1
+	MEMORY = 2
+	STATUS = 3
+	COUNT = 4
+
+# output report code -> priority class. Unknown reports are CONTROL
+COMMAND_PRIORITY = {
+	WiiProtoReqs.WIIPROTO_REQ_RUMBLE: WiiCmdPriority.FEEDBACK,
+	WiiProtoReqs.WIIPROTO_REQ_SPEAKER: WiiCmdPriority.FEEDBACK,
+	WiiProtoReqs.WIIPROTO_REQ_SPEAKER_DATA: WiiCmdPriority.FEEDBACK,
+	WiiProtoReqs.WIIPROTO_REQ_SPEAKER_MUTE: WiiCmdPriority.FEEDBACK,
+	WiiProtoReqs.WIIPROTO_REQ_LED: WiiCmdPriority.CONTROL,
+	WiiProtoReqs.WIIPROTO_REQ_DRM: WiiCmdPriority.CONTROL,
+	WiiProtoReqs.WIIPROTO_REQ_IR1: WiiCmdPriority.CONTROL,
+	WiiProtoReqs.WIIPROTO_REQ_IR2: WiiCmdPriority.CONTROL,
+	WiiProtoReqs.WIIPROTO_REQ_WMEM: WiiCmdPriority.MEMORY,
+	WiiProtoReqs.WIIPROTO_REQ_RMEM: WiiCmdPriority.MEMORY,
+	WiiProtoReqs.WIIPROTO_REQ_SREQ: WiiCmdPriority.STATUS
+}
+
+# Output reports that set the whole remote state they carry: only the newest
+# one matters (see WiiSendQueue.put)
+COALESCED_COMMANDS = frozenset([
+	WiiProtoReqs.WIIPROTO_REQ_RUMBLE,
+	WiiProtoReqs.WIIPROTO_REQ_LED,
+	WiiProtoReqs.WIIPROTO_REQ_DRM
+])
+
+class WiiSendQueue(threading.Thread):
+	# Output reports of one device. Each device has its own sender thread, so
+	# a remote with a slow link does not delay commands to the other ones.
+	# Within a device, commands leave in priority order, FIFO inside a class
+	def __init__(self, device):
+		threading.Thread.__init__(self)
+		self.device = device
+		self.queues = [collections.deque() for i in range(WiiCmdPriority.COUNT)]
+		self.cond = threading.Condition()
+		self.running = True
+		# Counters. Wait times are in seconds, from send() to the socket write
+		self.depth = 0
+		self.maxDepth = 0
+		self.sentCommands = 0
+		self.waitTime = [0.0]*WiiCmdPriority.COUNT
+		self.maxWait = [0.0]*WiiCmdPriority.COUNT
+		self.replacedCommands = 0
+		self.droppedCommands = 0
+		# report code -> last state sent, for COALESCED_COMMANDS
+		self.lastState = {}
+		
+	def put(self, data, priority=None):
+		code = data[0]
+		if priority == None:
+			priority = COMMAND_PRIORITY.get(code, WiiCmdPriority.CONTROL)
+		with self.cond:
+			if code in COALESCED_COMMANDS:
+				data = tuple(data)
+				q = self.queues[priority]
+				for i in range(len(q)):
+					if q[i][1][0] == code:
+						# Still pending: the newer state replaces it in place
+						self.replacedCommands += 1
+						if self.lastState.get(code) == data:
+							del q[i]
+							self.depth -= 1
+						else:
+							q[i] = (q[i][0], data)
+						return
+				if self.lastState.get(code) == data:
+					self.droppedCommands += 1
+					return
+			self.queues[priority].append((monotonic(), data))
+			self.depth += 1
+			if self.depth > self.maxDepth:
+				self.maxDepth = self.depth
+			self.cond.notify()
+			
+	def get(self):
+		# Highest priority command, or None when stopped
+		with self.cond:
+			while self.running and self.depth == 0:
+				self.cond.wait()
+			if not self.running:
+				return None
+			for priority in range(WiiCmdPriority.COUNT):
+				if self.queues[priority]:
+					break
+			self.depth -= 1
+			queued, data = self.queues[priority].popleft()
+			if data[0] in COALESCED_COMMANDS:
+				self.lastState[data[0]] = data
+		wait = monotonic() - queued
+		self.waitTime[priority] += wait
+		if wait > self.maxWait[priority]:
+			self.maxWait[priority] = wait
+		return data
+		
+	def run(self):
+		while True:
+			data = self.get()
+			if data == None:
+				break
+			try:
+				ret = self.device._send_data(data)
+			except Exception as e:
+				logging.debug("libwiimote::send_queue::%s: %s" % (self.device.address, str(e)))
+				self.forget(data[0])
+				self.device.disconnect()
+				continue
+			self.sentCommands += 1
+			if ret <= 0:
+				self.forget(data[0])
+				self.device.commandFailed()
+				
+	def forget(self, code):
+		# The remote state set by this report is no longer known: the next
+		# one is sent even if it is equal to the last one
+		with self.cond:
+			self.lastState.pop(code, None)
+				
+	def stop(self):
+		# Pending commands are dropped
+		with self.cond:
+			self.running = False
+			self.cond.notify()
+
+class WiiTimerWheel():
+	# Hashed timer wheel with TICK resolution. Deadlines farther than the
+	# wheel span come due early and are simply scheduled again
+	TICK = 0.25
+	SLOTS = 64
+	
+	def __init__(self):
+		self.slots = [set() for i in range(self.SLOTS)]
+		self.slot_of = {}
+		self.position = 0
+		self.time = monotonic()
+		
+	def schedule(self, item, when):
+		ticks = int((when - self.time) / self.TICK) + 1
+		ticks = max(1, min(ticks, self.SLOTS - 1))
+		self.remove(item)
+		slot = (self.position + ticks) % self.SLOTS
+		self.slots[slot].add(item)
+		self.slot_of[item] = slot
+		
+	def remove(self, item):
+		slot = self.slot_of.pop(item, None)
+		if slot != None:
+			self.slots[slot].discard(item)
+			
+	def expire(self, now):
+		# Items whose deadline is before now
+		due = []
+		if now - self.time >= self.SLOTS * self.TICK:
+			# Slept through a whole turn
+			self.time = now - self.SLOTS * self.TICK
+		while self.time + self.TICK <= now:
+			self.time += self.TICK
+			self.position = (self.position + 1) % self.SLOTS
+			slot = self.slots[self.position]
+			for item in slot:
+				del self.slot_of[item]
+			due.extend(slot)
+			slot.clear()
+		return due
+		
+	def next(self):
+		# Time when the next non empty slot comes due, None if empty
+		for ticks in range(1, self.SLOTS):
+			if self.slots[(self.position + ticks) % self.SLOTS]:
+				return self.time + ticks * self.TICK
+		return None
 
 class WiiCommandQueue(threading.Thread):
-	queue = None
+	# Owns the per device send queues and tracks device liveness. Any
+	# incoming report proves the device is alive: the receiver only stores
+	# its time in WiiDevice.lastseen. When a device check comes due in the
+	# timer wheel after livenessSilence seconds without reports, a status
+	# request is sent as a probe, and if nothing arrives in livenessTimeout
+	# seconds more the device is disconnected
 	
 	def __init__(self):
 		threading.Thread.__init__(self)
 		self.devices = []
-		self.queue = queue.Queue()
 		self.lock = threading.RLock()
 		self.running = True
+		self.wakeup = threading.Event()
+		self.wheel = WiiTimerWheel()
 			
 	def run(self):
 		logging.debug("libwiimote::command_queue::started")
-		# poll device to detect device disconnection
 		while self.running:
-			try:
-				device, command = self.queue.get(block=True, timeout=0.5)
-				ret = device._send_data(command)
-				if ret <= 0:
-					device.state.cmd_error = 0xff
-					device.state.command_ready.notify()
-			except:
-				pass
-			
-			for device in self.devices:
-				device.laststatusN += 1
-				# Each 5 seconds (or less if there was some commands), check time, and send status request
-				if device.laststatusN >= 7:
-					if time.time() > device.laststatus:
-						device.laststatusN = 0
-						device.laststatus = time.time() + 5
-						msg = [WiiProtoReqs.WIIPROTO_REQ_SREQ] + [device.wiiproto_cmd_keep_rumble(0x00)]
-						try:
-							device._send_data(msg)
-						except:
-							device.disconnect()
-					else:
-						device.laststatusN = 0
+			with self.lock:
+				due = self.wheel.next()
+			self.wakeup.wait(None if due == None else max(0, due - monotonic()))
+			self.wakeup.clear()
+			# Dead devices are disconnected without holding the lock, since
+			# disconnecting takes the device locks, which command senders
+			# hold while they take this one
+			dead = []
+			with self.lock:
+				now = monotonic()
+				for device in self.wheel.expire(now):
+					if not self.checkDevice(device, now):
+						dead.append(device)
+			for device in dead:
+				device.disconnect()
 		logging.debug("libwiimote::command_queue::stopped")
+		
+	def checkDevice(self, device, now):
+		# Returns False if the device must be disconnected
+		if device.lastseen + device.livenessSilence > now:
+			deadline = device.lastseen + device.livenessSilence
+			if device.laststatus + device.statusInterval <= now:
+				# Refresh battery level even if the device is streaming
+				self.sendStatusRequest(device, now)
+		elif device.probetime < device.lastseen:
+			# Silent for too long, and no probe since the last report
+			device.probetime = now
+			device.livenessProbes += 1
+			self.sendStatusRequest(device, now)
+			deadline = now + device.livenessTimeout
+		elif device.probetime + device.livenessTimeout <= now:
+			logging.debug("libwiimote::command_queue::%s: no reply to status probe" % device.address)
+			return False
+		else:
+			deadline = device.probetime + device.livenessTimeout
+		self.wheel.schedule(device, min(deadline, device.laststatus + device.statusInterval))
+		return True
+		
+	def sendStatusRequest(self, device, now):
+		device.laststatus = now
+		msg = [WiiProtoReqs.WIIPROTO_REQ_SREQ] + [device.wiiproto_cmd_keep_rumble(0x00)]
+		device.sendqueue.put(msg)
 			
 	def delDevice(self, device):
 		with self.lock:
 			if device in self.devices:
 				self.devices.remove(device)
+				self.wheel.remove(device)
+				device.sendqueue.stop()
 			if len(self.devices) <= 0:
 				self.stop()
 			
 	def stop(self):
 		self.running = False
+		self.wakeup.set()
+		with self.lock:
+			for device in self.devices:
+				device.sendqueue.stop()
 		global cmd_queue
 		cmd_queue = WiiCommandQueue()
 		
 	def send(self, device, data):
-		if not device in self.devices:
-			device.laststatus = time.time()
-			device.laststatusN = 0
-			self.devices.append(device)
-		self.queue.put((device, data))
-		if not self.isAlive():
-			self.start()
+		if device.isDisconnected:
+			return
+		with self.lock:
+			if not device in self.devices:
+				now = monotonic()
+				device.lastseen = now
+				device.laststatus = now
+				device.probetime = 0
+				device.sendqueue = WiiSendQueue(device)
+				device.sendqueue.start()
+				self.devices.append(device)
+				self.wheel.schedule(device, now + device.livenessSilence)
+				self.wakeup.set()
+			device.sendqueue.put(data)
+			if not self.is_alive():
+				self.start()
 
 class WiiDeviceReceiver(threading.Thread):
+	POLL_MASK = select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP
+	
 	def __init__(self):
 		threading.Thread.__init__(self)
-		self.devices = []
+		# fd -> WiiDevice, and the reverse index for O(1) removal
+		self.devices = {}
+		self.fds = {}
 		self.lock = threading.RLock()
+		self.running = True
+		self.rr_index = 0
+		self.epoll = select.epoll()
+		self.wakeup_rfd, self.wakeup_wfd = open_wakeup_fd()
+		self.epoll.register(self.wakeup_rfd, select.EPOLLIN)
 		
 	def getDeviceByDataSocket(self, datasocket):
-		for d in self.devices[:]:
-			if d.datasocket == datasocket:
-				return d
-		return None
+		return self.devices.get(datasocket.fileno())
 		
-	def readFromDataSockets(self):
-		sockets = []
-		for d in self.devices:
-			sockets.append(d.datasocket)
-		inputready,outputready,exceptready = select.select(sockets, [], [], 0.5)
-		if len(inputready) <= 0:
-			raise Exception()
+	def readFromDataSockets(self, timeout=-1):
+		try:
+			events = self.epoll.poll(timeout)
+		except (IOError, OSError) as e:
+			# EINTR (python < 3.5)
+			if e.errno == errno.EINTR:
+				return []
+			raise
+		if coalesce_reports:
+			return self.drainDataSockets(events)
 		data = []
-		for inr in inputready[:]:
-			ev = inr.recv(32)
-			x = socket_to_bytearray(ev)
-			dev = self.getDeviceByDataSocket(inr)
-			if len(ev) <= 0:
+		for fd, mask in events:
+			if fd == self.wakeup_rfd:
+				clear_wakeup_fd(self.wakeup_rfd)
+				continue
+			dev = self.devices.get(fd)
+			if dev == None:
+				continue
+			try:
+				x = dev.rbuf.recv()
+			except (IOError, OSError):
+				x = b''
+			if len(x) <= 0:
+				self.unregister(fd)
+				dev.disconnect()
+				continue
+			data.append((dev, x, dev.rbuf.rxtime))
+		return data
+		
+	def drainDataSocket(self, fd, dev):
+		# Read every pending report without blocking. While the device
+		# reports continuously, its state reports are collapsed into the
+		# newest one, except the last report before a core button change;
+		# the rest are kept in order. In change-only mode every report is a
+		# change and none is dropped. The newest report stays in its buffer
+		# slot while the next one is received into the other slot; other
+		# reports are copied out. Returns (report, receive time) pairs
+		reports = []
+		latest = None
+		slot = 0
+		collapse = dev.continuousReports
+		for i in range(DRAIN_MAX_REPORTS):
+			try:
+				x = dev.rbuf.recv(slot, socket.MSG_DONTWAIT)
+			except (IOError, OSError) as e:
+				# Nothing (more) to read: a spurious wakeup or a drained
+				# socket. Other errors disconnect the device
+				if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+					break
+				x = b''
+			if len(x) <= 0:
+				self.unregister(fd)
 				dev.disconnect()
+				return []
+			if collapse and len(x) > 3 and x[1] in CONTINUOUS_REPORTS:
+				if latest != None:
+					last = latest[0]
+					if last[2] == x[2] and last[3] == x[3]:
+						dev.coalescedReports += 1
+					else:
+						# Keep the button state before the change, so
+						# quick taps are not lost
+						reports.append((bytearray(last), latest[1]))
+				latest = (x, dev.rbuf.rxtime)
+				slot ^= 1
+			else:
+				reports.append((bytearray(x), dev.rbuf.rxtime))
+		if latest != None:
+			reports.append(latest)
+		return reports
+		
+	def drainDataSockets(self, events):
+		batches = []
+		for fd, mask in events:
+			if fd == self.wakeup_rfd:
+				clear_wakeup_fd(self.wakeup_rfd)
 				continue
-			data.append((dev, x))
+			dev = self.devices.get(fd)
+			if dev == None:
+				continue
+			reports = self.drainDataSocket(fd, dev)
+			if len(reports) > 0:
+				batches.append((dev, reports))
+		if len(batches) <= 0:
+			return []
+		# Round-robin between devices, rotating the first one on each pass
+		self.rr_index = (self.rr_index + 1) % len(batches)
+		batches = batches[self.rr_index:] + batches[:self.rr_index]
+		data = []
+		index = 0
+		while len(batches) > 0:
+			for dev, reports in batches:
+				if index < len(reports):
+					x, rxtime = reports[index]
+					data.append((dev, x, rxtime))
+			index += 1
+			batches = [b for b in batches if index < len(b[1])]
 		return data
 		
 	def run(self):
 		logging.debug("libwiimote::receiver::started")
-		self.running = True
-		while self.running:
-			try:
+		try:
+			while self.running:
 				datas = self.readFromDataSockets()
-				for dev, data in datas[:]:
-					dev.processInputData(data)
-			except:
-				pass
-			
+				# Proof of life for the liveness check, one clock read per wakeup
+				now = monotonic()
+				clock = None
+				for dev, data, rxtime in datas:
+					dev.lastseen = now
+					if rxtime == None:
+						# No kernel timestamp: reports are timed when read, one
+						# clock read per wakeup
+						if clock == None:
+							clock = time.time()
+						rxtime = clock
+					try:
+						dev.processInputData(data, rxtime)
+					except Exception:
+						logging.debug("libwiimote::receiver::error processing report", exc_info=True)
+		finally:
+			self.close()
 		logging.debug("libwiimote::receiver::stopped")
 	
 	def addDevice(self, device):
-		if not device in self.devices:
-			self.devices.append(device)
-			if not self.isAlive():
+		with self.lock:
+			if device in self.fds:
+				return
+			fd = device.datasocket.fileno()
+			self.devices[fd] = device
+			self.fds[device] = fd
+			self.epoll.register(fd, self.POLL_MASK)
+			if not self.is_alive():
 				self.start()
+			else:
+				# Poll the new socket right away
+				signal_wakeup_fd(self.wakeup_wfd)
+				
+	def unregister(self, fd):
+		with self.lock:
+			dev = self.devices.pop(fd, None)
+			if dev != None:
+				del self.fds[dev]
+				try:
+					self.epoll.unregister(fd)
+				except (IOError, OSError, ValueError):
+					pass
 				
 	def delDevice(self, device):
 		with self.lock:
-			if device in self.devices:
-				self.devices.remove(device)
+			fd = self.fds.get(device)
+			if fd != None:
+				self.unregister(fd)
 			if len(self.devices) <= 0:
 				self.stop()
 				
+	def close(self):
+		with self.lock:
+			if self.epoll == None:
+				return
+			self.epoll.close()
+			self.epoll = None
+			close_wakeup_fd(self.wakeup_rfd, self.wakeup_wfd)
+				
 	def stop(self):
-		self.running = False
 		global receiver
-		receiver = WiiDeviceReceiver()
+		with self.lock:
+			self.running = False
+			if self.is_alive():
+				signal_wakeup_fd(self.wakeup_wfd)
+			else:
+				self.close()
+			if receiver is self:
+				receiver = WiiDeviceReceiver()
+
+# Drain-and-coalesce receive mode (see setReportCoalescing)
+coalesce_reports = False
+DRAIN_MAX_REPORTS = 32
 
 cmd_queue = WiiCommandQueue()
 receiver = WiiDeviceReceiver()
 
+def setReportCoalescing(enabled):
+	# When enabled, each ready data socket is drained on every wakeup and only
+	# the newest continuous-state report of each device is processed. Status,
+	# DATA and RETURN reports are always delivered
+	global coalesce_reports
+	coalesce_reports = enabled
+
 def disconnect():
 	cmd_queue.stop()
 	receiver.stop()
 
+class WiiTimeoutError(Exception):
+	# A synchronous command got no reply after all its retries
+	pass
+
+class WiiFuture():
+	# Minimal future for asynchronous commands (python 2 has no
+	# concurrent.futures). error is 0 on success, the error code reported by
+	# the device, SEND_FAILED if the command could not be sent or the device
+	# disconnected, or TIMEOUT if the request was given up
+	SEND_FAILED = 0xff
+	TIMEOUT = 0xfe
+	
+	def __init__(self):
+		self.event = threading.Event()
+		self.value = None
+		self.error = 0
+		
+	def setResult(self, value, error=0):
+		self.value = value
+		self.error = error
+		self.event.set()
+		
+	def done(self):
+		return self.event.is_set()
+		
+	def wait(self, timeout=None):
+		# True if the result is available
+		return self.event.wait(timeout)
+		
+	def result(self, timeout=None):
+		self.event.wait(timeout)
+		return self.value
+
+class WiiMemRequest():
+	# Outstanding memory read/write, matched against DATA/RETURN reports
+	def __init__(self, reqtype, address, length):
+		self.type = reqtype
+		self.address = address
+		self.length = length
+		self.data = bytearray()
+		self.future = WiiFuture()
+
 class WiiHandler():
 	def __init__(self, code, size, handler):
 		self.handler = handler
@@ -616,13 +1341,46 @@ class WiiDevice():
 	extension_change_callback = None
 	isDisconnected = False
 	isConnected = False
-	disconnectLock = threading.RLock()
+	coalescedReports = 0
+	# Raw report deduplication (see setReportDeduplication)
+	dedupReports = True
+	heartbeat = 0
+	skippedReports = 0
+	# Synchronous command timeouts (see setCommandTimeout)
+	commandTimeout = 1.0
+	commandRetries = 2
+	commandBackoff = 2.0
+	commandTimeouts = 0
+	# Continuous reporting (see setDataSources)
+	continuousReports = True
+	# Output report queue, created on the first command (see WiiSendQueue)
+	sendqueue = None
+	# Liveness check (see WiiCommandQueue and setLivenessTimeouts). Times
+	# are monotonic()
+	livenessSilence = 3.0
+	livenessTimeout = 2.0
+	statusInterval = 60.0
+	livenessProbes = 0
+	lastseen = 0
+	laststatus = 0
+	probetime = 0
+	# Receive time of the report being processed (time.time() value), from
+	# the kernel when the data socket supports it (see enable_rx_timestamps)
+	rxtime = None
 	
 	def __init__(self, address, name, handler_keys, handler_accel, handler_ext, handler_sync, extension_change_callback=None, disconnect_callback=None):
 
 		self.address = address
 		self.name = name
+		self.disconnectLock = threading.RLock()
 		self.state = WiiDeviceState()
+		# Outstanding memory requests, oldest first
+		self.mem_requests = []
+		self.mem_lock = threading.Lock()
+		self.rbuf = WiiReportBuffer()
+		# report code -> last processed raw report
+		self.last_reports = {}
+		self.last_full_pass = 0
 		self.extension_change_callback = extension_change_callback
 		self.disconnect_callback = disconnect_callback
 		
@@ -632,6 +1390,7 @@ class WiiDevice():
 		self.handler_sync_callback = handler_sync
 		
 		# Event handler setup. Handlers must be sorted: first the one with larger size
+		# (see buildDispatchTable)
 		self.handlers = []
 		# DRM K
 		self.handlers.append(WiiHandler(WiiProtoReqs.WIIPROTO_REQ_DRM_K, 2, self.handler_drm_K))
@@ -644,6 +1403,20 @@ class WiiDevice():
 		# DRM KEE
 		self.handlers.append(WiiHandler(WiiProtoReqs.WIIPROTO_REQ_DRM_KEE, 21, self.handler_drm_KEE))
 		self.handlers.append(WiiHandler(WiiProtoReqs.WIIPROTO_REQ_DRM_KEE, 2, self.handler_drm_K))
+		self.buildDispatchTable()
+		self.updateDecoders()
+		
+	def buildDispatchTable(self):
+		# report code -> list indexed by report length -> first valid handler
+		self.dispatch = {}
+		for h in self.handlers:
+			table = self.dispatch.setdefault(h.code, [None]*(WiiReportBuffer.SIZE+1))
+			for length in range(len(table)):
+				if table[length] is None and h.isValid(h.code, length-1):
+					table[length] = h
+					
+	def updateDecoders(self):
+		self.decoders = WiiDecoders(self)
 		
 	def handler_keys(self, payload):
 		# Wiimote buttons and balance board button "A"
@@ -680,7 +1453,7 @@ class WiiDevice():
 		pass
 	def handler_drm_KEE(self, payload):
 		self.handler_keys(payload)
-		self.handler_ext(payload[2:])
+		self.handler_ext(self.rbuf.sub(payload, 2))
 		self.handler_sync()
 		pass
 	def handler_drm_KIE(self, payload):
@@ -688,7 +1461,7 @@ class WiiDevice():
 	def handler_drm_KAE(self, payload):
 		self.handler_keys(payload)
 		self.handler_accel(payload)
-		self.handler_ext(payload[5:])
+		self.handler_ext(self.rbuf.sub(payload, 5))
 		self.handler_sync()
 		pass
 	def handler_drm_KAIE(self, payload):
@@ -700,54 +1473,212 @@ class WiiDevice():
 	def handler_drm_SKAI2(self, payload):
 		pass
 		
+	def setReportDeduplication(self, enabled, heartbeat=0):
+		# Skip input reports whose raw bytes equal the last processed report
+		# with the same code. If heartbeat (ms) is set, a full pass is still
+		# forced at least that often
+		self.dedupReports = enabled
+		self.heartbeat = heartbeat
+		self.resetReportFilter()
+		
+	def resetReportFilter(self):
+		# Process the next report of every kind, even if it is unchanged
+		self.last_reports = {}
+		
+	def isDuplicateReport(self, code, x):
+		last = self.last_reports.get(code)
+		if last is None:
+			self.last_reports[code] = bytearray(x)
+		elif last == x:
+			if self.heartbeat <= 0:
+				return True
+			now = monotonic()
+			if now < self.last_full_pass + self.heartbeat/1000.0:
+				return True
+			self.last_full_pass = now
+			return False
+		else:
+			last[:] = x
+		if self.heartbeat > 0:
+			self.last_full_pass = monotonic()
+		return False
+		
+	def setLivenessTimeouts(self, silence, timeout, status=60.0):
+		# A status request is sent after silence seconds without reports, and
+		# the device is disconnected if it does not answer in timeout seconds.
+		# The battery level is refreshed every status seconds
+		self.livenessSilence = silence
+		self.livenessTimeout = timeout
+		self.statusInterval = status
+		
+	def setCommandTimeout(self, timeout, retries=2, backoff=2.0):
+		# Synchronous commands wait timeout seconds for the reply, then resend
+		# the request up to retries times, multiplying the timeout by backoff
+		# each time, and finally raise WiiTimeoutError
+		self.commandTimeout = timeout
+		self.commandRetries = retries
+		self.commandBackoff = backoff
+		
+	def retry_command(self, name, send):
+		# send() issues the request and returns a function that waits for the
+		# reply with a timeout, returning False if there was none
+		timeout = self.commandTimeout
+		for attempt in range(self.commandRetries + 1):
+			if send()(timeout) or self.isDisconnected:
+				return
+			self.commandTimeouts += 1
+			logging.debug("%s: %s timed out after %.2fs (attempt %d)" % (self.address, name, timeout, attempt + 1))
+			timeout *= self.commandBackoff
+		raise WiiTimeoutError("%s: no reply to %s" % (self.address, name))
+		
+	def wait_mem_requests(self, name, send):
+		# send() queues one or more memory requests and returns their futures.
+		# Requests without reply when the timeout expires are discarded, so a
+		# late reply can not complete a retry of a different request
+		result = []
+		def attempt():
+			result[:] = send()
+			def wait(timeout):
+				deadline = monotonic() + timeout
+				for future in result:
+					if not future.wait(max(0, deadline - monotonic())) and self.discardMemRequest(future):
+						for f in result:
+							self.discardMemRequest(f)
+						return False
+				return True
+			return wait
+		self.retry_command(name, attempt)
+		return result
+		
 	def setExtensionChangeCallback(self, callback):
 		self.extension_change_callback = callback
 	
 	def _send_data(self,data):
 		msg = [self.CMD_SET_REPORT] + list(data)
-		str_data = array.array('B', msg).tostring()
+		str_data = bytes(bytearray(msg))
 		ret = self.sendsocket.send(str_data)
 		return ret
 
 	def wiiproto_cmd_wmem(self, address, value, eeprom=False):
-		with self.state.send_command:
-			with self.state.command_ready:
-				val = i2bs(value)
-				val_len=len(val)
-				val += [0]*(16-val_len)
-				mtype = 0x00 if eeprom else 0x04
-				msg = [WiiProtoReqs.WIIPROTO_REQ_WMEM] + [mtype] + i2bs(address) + [val_len] +val
-				self.state.cmd_type = WiiProtoReqs.WIIPROTO_REQ_WMEM
-				cmd_queue.send(self, msg)
-				self.state.command_ready.wait()
-				error = self.state.cmd_error
-				return error
+		future, = self.wait_mem_requests("WMEM", lambda: [self.wiiproto_cmd_wmem_async(address, value, eeprom)])
+		return future.error
 		
 	def wiiproto_cmd_rmem(self, address, length, eeprom=False):
-		with self.state.send_command:
-			with self.state.command_ready:
-				val_len=length
-				mtype = 0x00 if eeprom else 0x04
-				msg = [WiiProtoReqs.WIIPROTO_REQ_RMEM] + [mtype] + i2bs(address) + [(val_len >> 8)& 0xff] + [val_len & 0xff]
-				self.state.cmd_type = WiiProtoReqs.WIIPROTO_REQ_RMEM
-				cmd_queue.send(self, msg)
-				self.state.command_ready.wait()
-				# Check if probably desconnected
-				if self.state.cmd_error == 0xff:
-					return []
-				read_data = []
-				read_data[:] = self.state.cmd_buffer
-				return read_data
+		future, = self.wait_mem_requests("RMEM", lambda: [self.wiiproto_cmd_rmem_async(address, length, eeprom)])
+		# Check if probably desconnected
+		if future.error == WiiFuture.SEND_FAILED:
+			return []
+		return list(future.value)
+		
+	def wiiproto_cmd_wmem_async(self, address, value, eeprom=False):
+		# Returns a WiiFuture with the error code of the write. Several
+		# requests can be outstanding; RETURN reports are matched in order
+		val = i2bs(value)
+		val_len=len(val)
+		val += [0]*(16-val_len)
+		mtype = 0x00 if eeprom else 0x04
+		msg = [WiiProtoReqs.WIIPROTO_REQ_WMEM] + [mtype] + mem_address(address) + [val_len] +val
+		return self.queue_mem_request(WiiMemRequest(WiiProtoReqs.WIIPROTO_REQ_WMEM, address, val_len), msg)
+		
+	def wiiproto_cmd_rmem_async(self, address, length, eeprom=False):
+		# Returns a WiiFuture with the bytes read. DATA reports are matched by
+		# address, and reads larger than 16 bytes are reassembled
+		val_len=length
+		mtype = 0x00 if eeprom else 0x04
+		msg = [WiiProtoReqs.WIIPROTO_REQ_RMEM] + [mtype] + mem_address(address) + [(val_len >> 8)& 0xff] + [val_len & 0xff]
+		return self.queue_mem_request(WiiMemRequest(WiiProtoReqs.WIIPROTO_REQ_RMEM, address, val_len), msg)
+		
+	def queue_mem_request(self, request, msg):
+		with self.mem_lock:
+			if self.isDisconnected:
+				request.future.setResult(request.data, WiiFuture.SEND_FAILED)
+				return request.future
+			self.mem_requests.append(request)
+		cmd_queue.send(self, msg)
+		return request.future
+		
+	def discardMemRequest(self, future):
+		# Gives up a pending request. Returns False if it already completed
+		with self.mem_lock:
+			for request in self.mem_requests:
+				if request.future is future:
+					break
+			else:
+				return False
+			self.mem_requests.remove(request)
+		future.setResult(request.data, WiiFuture.TIMEOUT)
+		return True
+		
+	def handler_mem_data(self, x):
+		# x: a1 21 BB BB SE AA AA DD*16
+		size = (x[4] >> 4) + 1
+		error = x[4] & 0x0f
+		address = (x[5] << 8) | x[6]
+		with self.mem_lock:
+			for request in self.mem_requests:
+				if request.type == WiiProtoReqs.WIIPROTO_REQ_RMEM and ((request.address + len(request.data)) & 0xffff) == address:
+					break
+			else:
+				return
+			if not error:
+				request.data += x[7:7+size]
+				if len(request.data) < request.length:
+					return
+			self.mem_requests.remove(request)
+		request.future.setResult(request.data, error)
+		
+	def handler_mem_return(self, x):
+		# x: a1 22 BB BB RR EE (RR: acknowledged output report)
+		if x[4] != WiiProtoReqs.WIIPROTO_REQ_WMEM:
+			return
+		with self.mem_lock:
+			for request in self.mem_requests:
+				if request.type == WiiProtoReqs.WIIPROTO_REQ_WMEM:
+					break
+			else:
+				return
+			self.mem_requests.remove(request)
+		request.future.setResult(x[5], x[5])
+		
+	def commandFailed(self):
+		# An output report could not be sent, or the device disconnected:
+		# release every waiter
+		with self.state.command_ready:
+			self.state.cmd_error = WiiFuture.SEND_FAILED
+			self.state.command_ready.notify_all()
+		self.failMemRequests()
+		
+	def failMemRequests(self):
+		with self.mem_lock:
+			requests = self.mem_requests
+			self.mem_requests = []
+		for request in requests:
+			request.future.setResult(WiiFuture.SEND_FAILED if request.type == WiiProtoReqs.WIIPROTO_REQ_WMEM else request.data, WiiFuture.SEND_FAILED)
 				
 	def wiiproto_req_status(self):
 		with self.state.send_command:
 			with self.state.command_ready:
-				msg = [WiiProtoReqs.WIIPROTO_REQ_SREQ] + [self.wiiproto_cmd_keep_rumble(0x00)]
-				self.state.cmd_type = WiiProtoReqs.WIIPROTO_REQ_STATUS
-				cmd_queue.send(self, msg)
-				self.state.command_ready.wait()
+				def send():
+					if self.isDisconnected:
+						# Nothing would be sent: fail instead of waiting
+						self.state.cmd_error = WiiFuture.SEND_FAILED
+						return lambda timeout: True
+					msg = [WiiProtoReqs.WIIPROTO_REQ_SREQ] + [self.wiiproto_cmd_keep_rumble(0x00)]
+					self.state.cmd_type = WiiProtoReqs.WIIPROTO_REQ_STATUS
+					self.state.cmd_error = WiiFuture.TIMEOUT
+					cmd_queue.send(self, msg)
+					return wait
+				def wait(timeout):
+					deadline = monotonic() + timeout
+					while self.state.cmd_error == WiiFuture.TIMEOUT:
+						remaining = deadline - monotonic()
+						if remaining <= 0:
+							return False
+						self.state.command_ready.wait(remaining)
+					return True
+				self.retry_command("SREQ", send)
 				# Check if probably desconnected
-				if self.state.cmd_error == 0xff:
+				if self.state.cmd_error != 0x00:
 					return []
 				read_data = []
 				read_data[:] = self.state.cmd_buffer
@@ -777,7 +1708,7 @@ class WiiDevice():
 				self.state.flags |= WiiProtoState.FLAG_EXT_PLUGGED
 				# Call detect extension
 				logging.debug("New extension detected")
-				t1 = threading.Thread(target=self.init_extension, kwargs={"notify":True})
+				t1 = threading.Thread(target=self.update_extension)
 				t1.start()
 		else:
 			if self.state.flags & WiiProtoState.FLAG_EXT_PLUGGED:
@@ -787,7 +1718,7 @@ class WiiDevice():
 				self.state.flags &= ~WiiProtoState.FLAG_MP_ACTIVE
 				# Call detect extension (to disable extension)
 				logging.debug("Extension unplugged")
-				t1 = threading.Thread(target=self.init_extension, kwargs={"notify":True})
+				t1 = threading.Thread(target=self.update_extension)
 				t1.start()
 				
 		# Update battery
@@ -799,12 +1730,17 @@ class WiiDevice():
 			
 	def wiiproto_cmd_detect_ext(self):
 		if self.state.flags & WiiProtoState.FLAG_EXT_PLUGGED:
-			# init extension
-			self.wiiproto_cmd_wmem(0xa400f0, 0x55)
-			self.wiiproto_cmd_wmem(0xa400fb, 0x00)
-			# read extensions
-			rmem = self.wiiproto_cmd_rmem(0xa400fa, 6)
+			# init extension and read extension id, pipelined: the remote
+			# handles the requests in order
+			futures = self.wait_mem_requests("extension detection", lambda: [
+				self.wiiproto_cmd_wmem_async(0xa400f0, 0x55),
+				self.wiiproto_cmd_wmem_async(0xa400fb, 0x00),
+				self.wiiproto_cmd_rmem_async(0xa400fa, 6)])
+			future = futures[-1]
+			rmem = future.value
 			logging.debug("RMEM ext: "+repr(list(map(hex, rmem))))
+			if future.error or len(rmem) < 6:
+				return WiiDevExtension.WIIMOTE_EXT_NONE
 			if rmem[0] == 0xff and rmem[1] == 0xff and rmem[2] == 0xff and rmem[3] == 0xff and rmem[4] == 0xff and rmem[5] == 0xff:
 				return WiiDevExtension.WIIMOTE_EXT_NONE
 			if rmem[4] == 0x00 and rmem[5] == 0x00:
@@ -835,13 +1771,24 @@ class WiiDevice():
 				self.state.device = WiiDevType.WIIMOTE_DEV_PRO_CONTROLLER
 			else:
 				self.state.device = WiiDevType.WIIMOTE_DEV_UNKNOWN
+		self.updateDecoders()
 	
 	def init_extension(self, notify=False):
 		ext = self.wiiproto_cmd_detect_ext()
 		self.state.extension = ext
+		self.updateDecoders()
+		self.resetReportFilter()
 		logging.debug("Extension detected: "+repr(ext))
 		if notify and self.extension_change_callback != None:
 			self.extension_change_callback()
+			
+	def update_extension(self):
+		# Extension plugged/unplugged, run from its own thread
+		try:
+			self.init_extension(notify=True)
+		except WiiTimeoutError as e:
+			logging.warning(str(e))
+			self.disconnect()
 	
 	def init_detect(self):
 		self.wiiproto_req_status()
@@ -892,19 +1839,22 @@ class WiiDevice():
 		inputready,outputready,exceptready = select.select([self.datasocket], [], [], 0.3)
 		if len(inputready) <= 0:
 			return []
-		ev = inputready[0].recv(32)
-		x = socket_to_bytearray(ev)
-		return x
+		return bytearray(self.rbuf.recv())
 	
-	def processInputData(self, x):
+	def processInputData(self, x, rxtime=None):
+		self.rxtime = rxtime
 		if len(x)>0:
 			code = x[1]
 			if code == WiiProtoReqs.WIIPROTO_REQ_STATUS:
-				self.state.lastpoll = time.time()
+				# The remote expects the reporting mode to be set again after
+				# a status report
+				if self.sendqueue is not None:
+					self.sendqueue.forget(WiiProtoReqs.WIIPROTO_REQ_DRM)
 				handled = False
 				with self.state.command_ready:
 					if self.state.cmd_type == WiiProtoReqs.WIIPROTO_REQ_STATUS:
-						self.state.cmd_buffer = x[2:]
+						# Copy: x is only valid until the next report
+						self.state.cmd_buffer = bytearray(x[2:])
 						self.state.cmd_error = 0x00
 						self.handler_status(x[2:])
 						handled = True
@@ -913,32 +1863,27 @@ class WiiDevice():
 					self.handler_status(x[2:])
 						
 			elif code == WiiProtoReqs.WIIPROTO_REQ_DATA:
-				with self.state.command_ready:
-					if self.state.cmd_type == WiiProtoReqs.WIIPROTO_REQ_RMEM:
-						self.state.cmd_buffer = x[7:]
-						self.state.cmd_error = 0x00
-						self.state.command_ready.notify()
+				self.handler_mem_data(x)
 						
 			elif code == WiiProtoReqs.WIIPROTO_REQ_RETURN:
-				with self.state.command_ready:
-					if self.state.cmd_type == WiiProtoReqs.WIIPROTO_REQ_WMEM:
-						self.state.cmd_error = x[5]
-						self.state.command_ready.notify()
+				self.handler_mem_return(x)
+			elif self.dedupReports and self.isDuplicateReport(code, x):
+				self.skippedReports += 1
 			else:
 				# Invoke handler. Only the first matching handler is invoked
-				data = x[2:]
-				size = len(x)-1
-				for h in self.handlers[:]:
-					if h.isValid(code, size):
-						h.invoke(data)
-						break
-						
-		if self.state.lastpoll > 0 and self.state.lastpoll + 14 < time.time():
-			self.disconnect()
+				table = self.dispatch.get(code)
+				if table is not None:
+					h = table[min(len(x), WiiReportBuffer.SIZE)]
+					if h is not None:
+						h.invoke(self.rbuf.sub(x, 2))
+
 	
 	def _do_disconnect(self):
+		self.failMemRequests()
 		cmd_queue.delDevice(self)
 		receiver.delDevice(self)
+		if self.rbuf.sock is not self.datasocket:
+			self.rbuf.sock.close()
 		self.datasocket.close()
 		self.sendsocket.close()
 		
@@ -949,7 +1894,10 @@ class WiiDevice():
 	def disconnect(self, block=False):
 		with self.disconnectLock:
 			if not self.isDisconnected:
-				self.isDisconnected = True
+				with self.mem_lock:
+					self.isDisconnected = True
+				# Cancel pending commands now, not when the sockets are closed
+				self.commandFailed()
 				if block:
 					self._do_disconnect()
 				else:
@@ -976,12 +1924,17 @@ class WiiDevice():
 			self.datasocket = bluetooth.BluetoothSocket(bluetooth.L2CAP)
 			self.datasocket.connect((self.address,19))
 			logging.debug("Controller protocol v1")
+		self.rbuf.bind(open_reader_socket(self.datasocket))
 
 		receiver.addDevice(self)
-		status = self.wiiproto_req_status()
-		logging.debug("Status: "+repr(list(map(hex, status))))
-		
-		self.init_detect()
+		try:
+			status = self.wiiproto_req_status()
+			logging.debug("Status: "+repr(list(map(hex, status))))
+			
+			self.init_detect()
+		except WiiTimeoutError:
+			self.disconnect(block=True)
+			raise
 		self.wiiproto_req_drm()
 																
 		logging.debug("Connected to %s" % self.address)
@@ -1025,7 +1978,9 @@ class WiiDevice():
 		if drm == None:
 			drm = self.wiiproto_select_drm()
 		logging.debug("DRM request: %x"%drm)
-		cmd_queue.send(self, (WiiProtoReqs.WIIPROTO_REQ_DRM, self.wiiproto_cmd_keep_rumble(0x04), drm))
+		self.updateDecoders()
+		cont = 0x04 if self.continuousReports else 0x00
+		cmd_queue.send(self, (WiiProtoReqs.WIIPROTO_REQ_DRM, self.wiiproto_cmd_keep_rumble(cont), drm))
 		
 	def enableAccel(self):
 		self.state.flags |= WiiProtoState.FLAG_ACCEL
@@ -1041,6 +1996,21 @@ class WiiDevice():
 			self.wiiproto_req_drm()
 		
 	def disableExtension(self):
-		self.state.flags &= WiiProtoState.FLAG_EXT_USED
+		self.state.flags &= ~WiiProtoState.FLAG_EXT_USED
+		self.wiiproto_req_drm()
+		
+	def setDataSources(self, accel, ext, continuous=True):
+		# Enable exactly the data sources in use, with a single DRM request.
+		# Without continuous reporting the remote only sends a report when
+		# its data changes
+		self.continuousReports = continuous
+		if accel:
+			self.state.flags |= WiiProtoState.FLAG_ACCEL
+		else:
+			self.state.flags &= ~WiiProtoState.FLAG_ACCEL
+		if ext and self.state.flags & WiiProtoState.FLAG_EXT_PLUGGED:
+			self.state.flags |= WiiProtoState.FLAG_EXT_USED
+		else:
+			self.state.flags &= ~WiiProtoState.FLAG_EXT_USED
 		self.wiiproto_req_drm()
 	
\ No newline at end of file
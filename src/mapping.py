@@ -65,6 +65,14 @@ class WiimoteDescription():
 		ACCEL_Y : ABS_Params(_min=-500, _max=500, _fuzz=2, _flat=4),
 		ACCEL_Z : ABS_Params(_min=-500, _max=500, _fuzz=2, _flat=4)
 	}
+	
+	# Inputs that need the accelerometer or the extension data reported
+	accel_inputs = [BTN_SHAKE, ACCEL_X, ACCEL_Y, ACCEL_Z]
+	ext_inputs = []
+	# Inputs computed from analog data
+	analog_inputs = [BTN_SHAKE, ACCEL_X, ACCEL_Y, ACCEL_Z]
+	# (x, y) axes with a radial dead zone. Other axes have their own
+	stick_pairs = []
 
 class NunchukDescription(WiimoteDescription):
 	BTN_C = WiimoteDescription.SIZE
@@ -92,6 +100,10 @@ class NunchukDescription(WiimoteDescription):
 		ACCEL_NZ : ABS_Params(_min=-500, _max=500, _fuzz=2, _flat=4)
 	}.items()))
 	
+	ext_inputs = list(range(BTN_C, SIZE))
+	analog_inputs = WiimoteDescription.analog_inputs + [AXIS_X, AXIS_Y, BTN_NSHAKE, ACCEL_NX, ACCEL_NY, ACCEL_NZ]
+	stick_pairs = [(AXIS_X, AXIS_Y)]
+	
 class ClassicControllerDescription():
 	BTN_A = 0
 	BTN_B = 1
@@ -133,6 +145,11 @@ class ClassicControllerDescription():
 		AXIS_RT : ABS_Params(_min=-30, _max=30, _fuzz=1, _flat=1)
 	}
 	
+	accel_inputs = []
+	ext_inputs = list(range(SIZE))
+	analog_inputs = [AXIS_X, AXIS_Y, AXIS_RX, AXIS_RY, AXIS_LT, AXIS_RT]
+	stick_pairs = [(AXIS_X, AXIS_Y), (AXIS_RX, AXIS_RY)]
+	
 class ProControllerDescription():
 	BTN_A = 0
 	BTN_B = 1
@@ -169,6 +186,11 @@ class ProControllerDescription():
 		AXIS_RX : ABS_Params(_min=-0x400, _max=0x400, _fuzz=4, _flat=100),
 		AXIS_RY : ABS_Params(_min=-0x400, _max=0x400, _fuzz=4, _flat=100)
 	}
+	
+	accel_inputs = []
+	ext_inputs = list(range(SIZE))
+	analog_inputs = [AXIS_X, AXIS_Y, AXIS_RX, AXIS_RY]
+	stick_pairs = [(AXIS_X, AXIS_Y), (AXIS_RX, AXIS_RY)]
 
 class MappingProfile():
 	
@@ -199,6 +221,12 @@ class Mapping():
 	def getMapping(self, position):
 		return self.mapping[position]
 		
+	def usesInputs(self, positions):
+		for position in positions:
+			if self.mapping[position] != None:
+				return True
+		return False
+		
 	def isGamepadAssignment(self, key):
 		return (
 			(key._type == uinputdefs.EV_KEY and key._code[0] >= uinputdefs.BTN_DPAD_UP and key._code[0] <= uinputdefs.BTN_TRIGGER_HAPPY40) or
@@ -210,21 +238,38 @@ class Mapping():
 class ButtonMapping():
 	_type = uinputdefs.EV_KEY
 	
-	def __init__(self, key, sensitivity=None):
+	def __init__(self, key, sensitivity=None, release=0, hold=0):
 		if isinstance(key, list):
 			self._code = [key[0]]
 		else:
 			self._code = [key]
 		self.sensitivity = sensitivity
+		# Shake buttons: release threshold (0: default) and minimum time
+		# pressed in ms (0: default)
+		self.release = release
+		self.hold = hold
+
+# Axis filters (see AxisMapping.filterType)
+FILTER_NONE = 0
+FILTER_EMA = 1		# exponential moving average, params: (alpha %)
+FILTER_EURO = 2		# 1 euro filter, params: (minimum alpha %, beta %)
+FILTER_MEDIAN = 3	# median of the last 3 values, no params
 
 class AxisMapping():
 	_type = uinputdefs.EV_ABS
 	
-	def __init__(self, axis, sourceScale=None, deadZone=0, isInverted=False):
+	def __init__(self, axis, sourceScale=None, deadZone=0, isInverted=False, curve=100, antiDeadZone=0, filterType=FILTER_NONE, filterParams=()):
 		if isinstance(axis, list):
 			self._code = axis
 		else:
 			self._code = [axis]
 		self.isInverted = isInverted
 		self.deadZone = deadZone
-		self.sourceScale = sourceScale
\ No newline at end of file
+		self.sourceScale = sourceScale
+		# Response curve exponent in percent (100: linear), and output
+		# anti dead zone in percent of the axis range
+		self.curve = curve
+		self.antiDeadZone = antiDeadZone
+		# Filter applied to the source values, before the dead zone
+		self.filterType = filterType
+		self.filterParams = filterParams
\ No newline at end of file
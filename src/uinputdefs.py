@@ -28,11 +28,16 @@ import ioctlhelp
 class timeval(ctypes.Structure):
     _fields_ = [("tv_sec", ctypes.c_long), ("tv_usec", ctypes.c_long)]
 				
+def timestamp(t=None):
+	# (tv_sec, tv_usec) of a time.time() value, now by default
+	if t == None:
+		t = time.time()
+	sec = int(t)
+	return sec, int((t-sec)*1000000)
+
 def gettimeofday():
-	t = time.time()
 	tt = timeval()
-	tt.tv_sec = int(t)
-	tt.tv_usec = int((t-int(t))*1000000)
+	tt.tv_sec, tt.tv_usec = timestamp()
 	return tt
 
 class input_event(ctypes.Structure):
@@ -43,6 +48,11 @@ class input_event(ctypes.Structure):
         ("value", ctypes.c_int32)
     ]
 
+# input_event packed with struct, same layout as the ctypes structure. The
+# timeval part alone is TIMEVAL
+INPUT_EVENT = struct.Struct("@llHHi")
+TIMEVAL = struct.Struct("@ll")
+
 class input_id(ctypes.Structure):
     _fields_ = [
         ("bustype", ctypes.c_uint16),
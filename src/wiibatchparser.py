@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Vectorized companion of libwiimote.WiiDataParser for offline analysis of
+# recorded report streams. Every parser takes an (N, L) array of payloads,
+# exactly what the scalar parser would receive one at a time, and returns a
+# structured array whose rows (.tolist()) equal the scalar parser tuples.
+# See libwiimote.WiiDataParser for the report layouts.
+import numpy
+
+import libwiimote
+
+def _dtype(axes, buttons):
+	return numpy.dtype([(a, numpy.int32) for a in axes] + [(b, numpy.bool_) for b in buttons])
+
+KEYS_DTYPE = _dtype([], ["btn_left", "btn_right", "btn_up", "btn_down", "btn_minus", "btn_home", "btn_plus", "btn_a", "btn_b", "btn_1", "btn_2"])
+ACCEL_DTYPE = _dtype(["x", "y", "z"], [])
+NUNCHUK_DTYPE = _dtype(["bx", "by", "x", "y", "z"], ["btn_c", "btn_z"])
+CLASSIC_DTYPE = _dtype(["lx", "ly", "rx", "ry", "lt", "rt"], ["btn_left", "btn_right", "btn_up", "btn_down", "btn_minus", "btn_home", "btn_plus",
+	"btn_a", "btn_b", "btn_x", "btn_y", "btn_lt", "btn_rt", "btn_zl", "btn_zr"])
+PRO_DTYPE = _dtype(["lx", "ly", "rx", "ry"], ["btn_left", "btn_right", "btn_up", "btn_down", "btn_minus", "btn_home", "btn_plus",
+	"btn_a", "btn_b", "btn_x", "btn_y", "btn_tl", "btn_tr", "btn_zl", "btn_zr", "btn_thumbl", "btn_thumbr"])
+
+def reportPayloads(reports, code, offset=0, length=None):
+	# Stack the payloads of every raw report (as read from the data socket:
+	# 0xa1, code, payload...) with the given code. offset skips leading
+	# payload bytes (2 for DRM_KEE extension data, 5 for DRM_KAE)
+	rows = [bytearray(r[2+offset:]) for r in reports if len(r) > 1 and r[1] == code]
+	if length is None:
+		length = min([len(r) for r in rows]) if len(rows) > 0 else 0
+	out = numpy.zeros((len(rows), length), dtype=numpy.uint8)
+	for i, r in enumerate(rows):
+		out[i, :len(r[:length])] = numpy.frombuffer(bytes(r[:length]), dtype=numpy.uint8)
+	return out
+
+def _columns(payloads):
+	return numpy.asarray(payloads, dtype=numpy.uint8).astype(numpy.int32)
+
+class WiiBatchParser():
+	@staticmethod
+	def parseWiimoteKeys(payloads):
+		p = _columns(payloads)
+		out = numpy.zeros(len(p), dtype=KEYS_DTYPE)
+		out["btn_left"] = p[:, 0] & 0x01
+		out["btn_right"] = p[:, 0] & 0x02
+		out["btn_down"] = p[:, 0] & 0x04
+		out["btn_up"] = p[:, 0] & 0x08
+		out["btn_plus"] = p[:, 0] & 0x10
+		out["btn_2"] = p[:, 1] & 0x01
+		out["btn_1"] = p[:, 1] & 0x02
+		out["btn_b"] = p[:, 1] & 0x04
+		out["btn_a"] = p[:, 1] & 0x08
+		out["btn_minus"] = p[:, 1] & 0x10
+		out["btn_home"] = p[:, 1] & 0x80
+		return out
+
+	@staticmethod
+	def parseWiimoteAccel(accel, device=libwiimote.WiiDevType.WIIMOTE_DEV_GEN20):
+		p = _columns(accel)
+		zero = 0x1e7 if device == libwiimote.WiiDevType.WIIMOTE_DEV_GEN10 else 0x200
+		out = numpy.zeros(len(p), dtype=ACCEL_DTYPE)
+		out["x"] = ((p[:, 2] << 2) | ((p[:, 0] >> 5) & 0x3)) - zero
+		out["y"] = ((p[:, 3] << 2) | ((p[:, 1] >> 4) & 0x2)) - zero
+		out["z"] = ((p[:, 4] << 2) | ((p[:, 1] >> 5) & 0x2)) - zero
+		return out
+
+	@staticmethod
+	def parseNunchuk(ext, mp=False):
+		p = _columns(ext)
+		out = numpy.zeros(len(p), dtype=NUNCHUK_DTYPE)
+		out["bx"] = p[:, 0] - 128
+		out["by"] = 128 - p[:, 1]
+		if mp:
+			out["x"] = ((p[:, 2] << 2) | ((p[:, 5] >> 3) & 0x02)) - 0x200
+			out["y"] = ((p[:, 3] << 2) | ((p[:, 5] >> 4) & 0x02)) - 0x200
+			out["z"] = (((p[:, 4] << 2) & ~0x4) | ((p[:, 5] >> 5) & 0x06)) - 0x200
+			out["btn_z"] = (p[:, 5] & 0x04) == 0
+			out["btn_c"] = (p[:, 5] & 0x08) == 0
+		else:
+			out["x"] = ((p[:, 2] << 2) | ((p[:, 5] >> 2) & 0x03)) - 0x200
+			out["y"] = ((p[:, 3] << 2) | ((p[:, 5] >> 4) & 0x03)) - 0x200
+			out["z"] = ((p[:, 4] << 2) | ((p[:, 5] >> 6) & 0x03)) - 0x200
+			out["btn_z"] = (p[:, 5] & 0x01) == 0
+			out["btn_c"] = (p[:, 5] & 0x02) == 0
+		return out
+
+	@staticmethod
+	def parseClassic(ext, mp=False):
+		p = _columns(ext)
+		out = numpy.zeros(len(p), dtype=CLASSIC_DTYPE)
+		lmask = 0x3e if mp else 0x3f
+		out["lx"] = (p[:, 0] & lmask) - 0x20
+		out["ly"] = 0x20 - (p[:, 1] & lmask)
+		rx = ((p[:, 0] >> 3) & 0x18) | ((p[:, 1] >> 5) & 0x06) | ((p[:, 2] >> 7) & 0x01)
+		lt = ((p[:, 2] >> 2) & 0x18) | ((p[:, 3] >> 5) & 0x07)
+		out["rx"] = (rx << 1) - 0x20
+		out["ry"] = 0x20 - ((p[:, 2] & 0x1f) << 1)
+		out["lt"] = (lt << 1) - 30
+		out["rt"] = ((p[:, 3] & 0x1f) << 1) - 30
+		WiiBatchParser._classicButtons(p[:, 4], p[:, 5], out, "btn_lt", "btn_rt")
+		if mp:
+			out["btn_left"] = (p[:, 1] & 0x01) == 0
+			out["btn_up"] = (p[:, 0] & 0x01) == 0
+		return out
+
+	@staticmethod
+	def parseProController(ext, calib=None):
+		# calib is the [lx, ly, rx, ry] zero-point correction. When not given,
+		# it is computed from the first report like the scalar parser does
+		p = _columns(ext)
+		out = numpy.zeros(len(p), dtype=PRO_DTYPE)
+		lx = (p[:, 0] | ((p[:, 1] & 0x0f) << 8)) - 0x800
+		rx = (p[:, 2] | ((p[:, 3] & 0x0f) << 8)) - 0x800
+		ly = 0x800 - (p[:, 4] | ((p[:, 5] & 0x0f) << 8))
+		ry = 0x800 - (p[:, 6] | ((p[:, 7] & 0x0f) << 8))
+		if calib is None:
+			calib = [0, 0, 0, 0]
+			if len(p) > 0:
+				for i, v in enumerate((lx[0], ly[0], rx[0], ry[0])):
+					if abs(v) < 500:
+						calib[i] = -int(v)
+		out["lx"] = lx + calib[0]
+		out["ly"] = ly + calib[1]
+		out["rx"] = rx + calib[2]
+		out["ry"] = ry + calib[3]
+		WiiBatchParser._classicButtons(p[:, 8], p[:, 9], out, "btn_tl", "btn_tr")
+		out["btn_thumbl"] = (p[:, 10] & 0x02) == 0
+		out["btn_thumbr"] = (p[:, 10] & 0x01) == 0
+		return out
+
+	@staticmethod
+	def _classicButtons(b0, b1, out, tl, tr):
+		# Shared by the Classic Controller (ext[4], ext[5]) and the Pro
+		# Controller (ext[8], ext[9]). All buttons are low-active
+		out["btn_right"] = (b0 & 0x80) == 0
+		out["btn_down"] = (b0 & 0x40) == 0
+		out[tl] = (b0 & 0x20) == 0
+		out["btn_minus"] = (b0 & 0x10) == 0
+		out["btn_home"] = (b0 & 0x08) == 0
+		out["btn_plus"] = (b0 & 0x04) == 0
+		out[tr] = (b0 & 0x02) == 0
+		out["btn_zl"] = (b1 & 0x80) == 0
+		out["btn_b"] = (b1 & 0x40) == 0
+		out["btn_y"] = (b1 & 0x20) == 0
+		out["btn_a"] = (b1 & 0x10) == 0
+		out["btn_x"] = (b1 & 0x08) == 0
+		out["btn_zr"] = (b1 & 0x04) == 0
+		out["btn_left"] = (b1 & 0x02) == 0
+		out["btn_up"] = (b1 & 0x01) == 0
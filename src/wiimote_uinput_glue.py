@@ -17,8 +17,10 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
+import array
 import bluetooth
 import logging
+import threading
 
 import libuinput
 import libwiimote
@@ -26,14 +28,6 @@ import uinputdefs
 import mapping
 import fileutils
 
-def getevent(typ, code, value):
-	ev = uinputdefs.input_event()
-	ev.time = uinputdefs.gettimeofday()
-	ev.type = typ
-	ev.code = code
-	ev.value = value
-	return ev
-
 PROFILE_UNKNOWN = 0
 PROFILE_WIIMOTE = 1
 PROFILE_WIIMOTE_NUNCHUK = 2
@@ -41,6 +35,42 @@ PROFILE_CLASSIC_CONTROLLER = 3
 PROFILE_PRO_CONTROLLER = 4
 PROFILE_BALANCE_BOARD = 5
 
+# Change-only reporting for mappings without analog inputs (see
+# setChangeOnlyReports)
+change_only_reports = False
+
+def setChangeOnlyReports(enabled):
+	# When enabled, devices whose mapping uses only digital inputs stop
+	# continuous reporting: the remote sends a report only when its state
+	# changes. Devices go back to continuous reporting if an analog input
+	# gets mapped
+	global change_only_reports
+	change_only_reports = enabled
+
+# Idle downshift (see setIdleTimeout). Axis moves smaller than this fraction
+# of the axis range do not count as activity
+idle_timeout = 0
+IDLE_AXIS_DELTA = 0.1
+
+def setIdleTimeout(seconds):
+	# After seconds without button changes or axis moves, devices switch to a
+	# buttons-only, change-triggered report mode. The first button press
+	# restores the full mode. 0 disables it
+	global idle_timeout
+	idle_timeout = seconds
+
+# Rate-decoupled output (see setEmitRate). 0 sends each report as it comes
+emit_rate = 0
+
+def setEmitRate(hz):
+	# When set, devices keep the latest mapped state and send what changed
+	# hz times per second, from a single timer for all devices. Button
+	# changes are still sent with the report that brings them. 0 disables it.
+	# Devices already created follow it through updateEmitRate
+	global emit_rate
+	emit_rate = hz
+	emitter.wakeup.set()
+
 def getNumberOfGamepads():
 	f = open('/proc/bus/input/devices', 'r')
 	n = 0
@@ -86,12 +116,284 @@ def compute_single_deadzone(_axmap, _axmax, ax):
 			return ax < _axlim and ax > -_axlim
 	return False
 
+# Compiled mapping plan opcodes (see compile_mapping)
+OP_BUTTON = 0		# button -> button
+OP_BUTTON_AXIS = 1	# button -> axis, -1 or 1
+OP_AXIS_BUTTON = 2	# axis -> button, pressed over the sensitivity
+OP_AXIS = 3			# axis -> axis, through a lookup table
+OP_AXIS_SPLIT = 4	# axis -> two axes, one per direction, through a lookup table
+OP_AXIS_RAW = 5		# axis -> axis, value sent as is
+
+# Source values covered by the axis lookup tables, in units of the axis
+# range. Values out of the table are transformed on the fly
+AXIS_LUT_RANGE = 4
+
+def axis_transform(_map, _abs, single_deadzone):
+	# Returns the function applied to the values of an axis -> axis mapping:
+	# dead zone (unpaired axes, see compute_deadzones for sticks), inversion,
+	# scale, response curve, anti dead zone and 1 axis to 2 axis split. Split
+	# values are ((code, value), (code, value)) in sending order
+	_max = _abs.max
+	scale = None
+	if _map.sourceScale != None and _map.sourceScale > 0:
+		scale = _max / float(_map.sourceScale)
+	curve = _map.curve / 100.0
+	anti = _map.antiDeadZone / 100.0
+	split = len(_map._code) >= 2
+	def transform(value):
+		if single_deadzone and compute_single_deadzone(_map, _max, value):
+			value = 0
+		# Apply axis inversion
+		if _map.isInverted:
+			value = -value
+		# Apply axis scale
+		if scale != None:
+			value = int(scale*value)
+		# Apply response curve and anti dead zone
+		if value != 0 and (curve != 1 or anti > 0):
+			n = (abs(value) / float(_max)) ** curve
+			n = anti + n*(1 - anti)
+			value = int(round(n*_max)) if value > 0 else -int(round(n*_max))
+		# Apply 1 axis to 2 axis
+		if not split:
+			return value
+		if value > 0:
+			return ((_map._code[1], value-(_abs.max//2)), (_map._code[0], _abs.min))
+		elif value < 0:
+			return ((_map._code[0], (-value)-(_abs.max//2)), (_map._code[1], _abs.min))
+		return ((_map._code[0], _abs.min), (_map._code[1], _abs.min))
+	return transform
+
+def compile_mapping(_mapping):
+	# Resolve once per mapping how each source input is sent. Returns a list
+	# indexed by source input, with None for unmapped inputs or (opcode,
+	# type, code0, code1, offset, table, arg, transform). For the axis ->
+	# axis opcodes, table[value + offset] is the transformed value and
+	# transform computes it for values out of the table. arg is the
+	# sensitivity for OP_AXIS_BUTTON, and the source ABS_Params for the axis
+	# opcodes
+	pd = _mapping.description
+	paired = set()
+	for ix, iy in pd.stick_pairs:
+		paired.add(ix)
+		paired.add(iy)
+	plan = [None]*len(_mapping.mapping)
+	for index, _map in enumerate(_mapping.mapping):
+		if _map == None:
+			continue
+		isNaturalAxis = pd.axis[index]
+		_abs = pd.abs_params[index] if isNaturalAxis else None
+		code0 = _map._code[0]
+		code1 = _map._code[1] if len(_map._code) >= 2 else None
+		if _map._type == uinputdefs.EV_ABS and not isNaturalAxis:
+			plan[index] = (OP_BUTTON_AXIS, _map._type, code0, None, 0, None, None, None)
+		elif _map._type == uinputdefs.EV_KEY and isNaturalAxis:
+			_sens = 30
+			if isinstance(_map, mapping.ButtonMapping) and _map.sensitivity != None:
+				_sens = _map.sensitivity
+			plan[index] = (OP_AXIS_BUTTON, _map._type, code0, None, 0, None, _sens, None)
+		elif isNaturalAxis:
+			if isinstance(_map, mapping.AxisMapping) and _abs != None:
+				transform = axis_transform(_map, _abs, not index in paired)
+				offset = AXIS_LUT_RANGE*_abs.max
+				table = [transform(v) for v in range(-offset, offset + 1)]
+				op = OP_AXIS_SPLIT if code1 != None else OP_AXIS
+				plan[index] = (op, _map._type, code0, code1, offset, table, _abs, transform)
+			else:
+				plan[index] = (OP_AXIS_RAW, _map._type, code0, None, 0, None, _abs, None)
+		else:
+			plan[index] = (OP_BUTTON, _map._type, code0, None, 0, None, None, None)
+	return plan
+
+def compute_deadzones(_mapping):
+	# Radial dead zones of the stick pairs, as a list indexed by the x axis
+	# source input. Each one is the 2D table of compute_deadzone over |x|,
+	# |y| stored by rows: (x, y) is in the dead zone if |x| < len(rows) and
+	# |y| < rows[|x|]
+	pd = _mapping.description
+	deadzones = [None]*len(_mapping.mapping)
+	for ix, iy in pd.stick_pairs:
+		_axmap = _mapping.mapping[ix]
+		_aymap = _mapping.mapping[iy]
+		_axmax = pd.abs_params[ix].max
+		_aymax = pd.abs_params[iy].max
+		rows = []
+		while compute_deadzone(_axmap, _aymap, _axmax, _aymax, len(rows), 0):
+			ay = 1
+			while compute_deadzone(_axmap, _aymap, _axmax, _aymax, len(rows), ay):
+				ay += 1
+			rows.append(ay)
+		if len(rows) > 0:
+			deadzones[ix] = rows
+	return deadzones
+
+# Speed smoothing of the 1 euro filter, in 1/256 units
+EURO_SPEED_ALPHA = 64
+
+def compile_filters(_mapping):
+	# Integer parameters of the axis filters, as a list indexed by source
+	# input with None for unfiltered inputs or (filter type, p0, p1, axis
+	# max). Alphas are in 1/256 units. Returns None if no input is filtered
+	pd = _mapping.description
+	filters = [None]*len(_mapping.mapping)
+	for index, _map in enumerate(_mapping.mapping):
+		if not isinstance(_map, mapping.AxisMapping) or not pd.axis[index]:
+			continue
+		_max = pd.abs_params[index].max
+		if _map.filterType == mapping.FILTER_EMA:
+			filters[index] = (_map.filterType, _map.filterParams[0]*256//100, 0, _max)
+		elif _map.filterType == mapping.FILTER_EURO:
+			filters[index] = (_map.filterType, _map.filterParams[0]*256//100, _map.filterParams[1], _max)
+		elif _map.filterType == mapping.FILTER_MEDIAN:
+			filters[index] = (_map.filterType, 0, 0, _max)
+	if filters.count(None) == len(filters):
+		return None
+	return filters
+
+# Shake detection (see ShakeDetector)
+SHAKE_SENSITIVITY = 260
+SHAKE_WINDOW = 8
+SHAKE_HOLD = 100
+
+class ShakeDetector():
+	# Shake button state from accelerometer samples. The shake strength is
+	# the peak of the squared 3 axis magnitude over the last SHAKE_WINDOW
+	# samples, so the button does not follow every swing of a shake. It is
+	# pressed over the press threshold, and released under the release
+	# threshold once pressed for at least hold ms
+	def __init__(self, press, release, hold):
+		self.press = press*press
+		self.release = release*release
+		self.hold = hold/1000.0
+		self.ring = array.array('l', [0]*SHAKE_WINDOW)
+		self.index = 0
+		self.pressed = 0
+		self.pressTime = 0
+		
+	def update(self, x, y, z):
+		self.ring[self.index] = x*x + y*y + z*z
+		self.index = (self.index + 1) % SHAKE_WINDOW
+		peak = max(self.ring)
+		if not self.pressed:
+			if peak >= self.press:
+				self.pressed = 1
+				self.pressTime = libwiimote.monotonic()
+		elif peak < self.release and libwiimote.monotonic() - self.pressTime >= self.hold:
+			self.pressed = 0
+		return self.pressed
+		
+def compile_shakers(_mapping):
+	# Shake detectors of the mapped shake buttons, as a dict indexed by
+	# source input
+	pd = _mapping.description
+	shakers = {}
+	for index in (getattr(pd, 'BTN_SHAKE', None), getattr(pd, 'BTN_NSHAKE', None)):
+		if index == None or _mapping.mapping[index] == None:
+			continue
+		_map = _mapping.mapping[index]
+		press = SHAKE_SENSITIVITY
+		release = 0
+		hold = SHAKE_HOLD
+		if isinstance(_map, mapping.ButtonMapping):
+			if _map.sensitivity != None and _map.sensitivity > 0:
+				press = _map.sensitivity
+			release = _map.release
+			if _map.hold > 0:
+				hold = _map.hold
+		if release <= 0 or release >= press:
+			release = press*3//4
+		shakers[index] = ShakeDetector(press, release, hold)
+	return shakers
+
+class UInputEmitter(threading.Thread):
+	# Single timer flushing the pending state of the rate-decoupled devices
+	# (see setEmitRate). Started with the first device
+	def __init__(self):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.devices = []
+		self.lock = threading.Lock()
+		self.wakeup = threading.Event()
+		self.started = False
+		
+	def addDevice(self, device):
+		with self.lock:
+			if not device in self.devices:
+				self.devices.append(device)
+			if not self.started:
+				self.started = True
+				self.start()
+		self.wakeup.set()
+				
+	def delDevice(self, device):
+		with self.lock:
+			if device in self.devices:
+				self.devices.remove(device)
+				
+	def run(self):
+		due = None
+		while True:
+			if emit_rate <= 0:
+				due = None
+				self.wakeup.wait()
+				self.wakeup.clear()
+				continue
+			period = 1.0 / emit_rate
+			now = libwiimote.monotonic()
+			if due == None or due - now > period:
+				# First tick, or the rate went up
+				due = now + period
+			if now < due:
+				self.wakeup.wait(due - now)
+				self.wakeup.clear()
+				continue
+			# Late ticks are skipped, not caught up
+			due += period
+			if due <= now:
+				due = now + period
+			with self.lock:
+				devices = self.devices[:]
+			for device in devices:
+				try:
+					device.flush()
+				except Exception:
+					logging.debug("UINPUT: error flushing pending events", exc_info=True)
+
+emitter = UInputEmitter()
+
 class UInputWiimote():
 	initialized = False
-	def __init__(self, address, name, mappingProfile, led=1, disconnectCallback=None):
+	# Last button masks sent to uinput (None: send every button)
+	lastKeyMask = None
+	lastExtMask = None
+	lastValues = {}
+	# Compiled self.mapping (see compile_mapping, compute_deadzones and
+	# compile_filters)
+	plan = []
+	deadzones = []
+	filters = None
+	filterState = None
+	shakers = {}
+	# Idle downshift state and counters (see setIdleTimeout)
+	isIdle = False
+	active = False
+	lastActivity = 0
+	idleDownshifts = 0
+	idleWakeups = 0
+	# Rate-decoupled output (see setEmitRate): emit() stores values in
+	# pending, sent by flush from the emitter or on button changes
+	deferred = False
+	edge = False
+	def __init__(self, address, name, mappingProfile, led=1, disconnectCallback=None, idleCallback=None):
 		self.uinputextension = libwiimote.WiiDevExtension.WIIMOTE_EXT_NONE
 		self.mappingProfile = mappingProfile
 		self.disconnectCallback = disconnectCallback
+		self.idleCallback = idleCallback
+		# axis index -> value at the last axis activity
+		self.idleAxes = {}
+		# (type, code) -> (value, ABS_Params) not sent yet
+		self.pending = {}
+		self.emitLock = threading.Lock()
 		self.profile = PROFILE_UNKNOWN
 		self.led = led
 		self.wiimotedev = libwiimote.WiiDevice(address, name, self.handler_keys, self.handler_accel, self.handler_ext, self.handler_sync, extension_change_callback=self.extension_change, disconnect_callback=self.device_disconnected)
@@ -117,8 +419,17 @@ class UInputWiimote():
 			
 		if self.mapping == None:
 			logging.warning("Your mapping profile does not have a mapping defined for your device combination")
+			self.wiimotedev.setDataSources(False, False)
 			self.initialized = False
 			return
+		self.compile_active_mapping()
+		# Filters must see every report to settle, and shake detectors to
+		# release the button once the shake window has passed, even with
+		# unchanged reports
+		dedup = self.filters == None and len(self.shakers) == 0
+		if self.wiimotedev.dedupReports != dedup:
+			self.wiimotedev.setReportDeduplication(dedup, self.wiimotedev.heartbeat)
+		self.update_data_sources()
 		
 		# Avoid Xorg server blacklist
 		if not self.mapping.isGamepad:
@@ -129,247 +440,348 @@ class UInputWiimote():
 		print("Battery level = %d %%"%self.wiimotedev.state.cmd_battery)
 		
 		logging.debug("Creating UInput device called \""+self.uinput_name+"\"")
+		self.reset_output_state()
+		if idle_timeout > 0 and self.wiimotedev.dedupReports:
+			# Unchanged reports are skipped: force a full pass often enough
+			# for handler_sync to notice the device is idle
+			heartbeat = idle_timeout * 500
+			if self.wiimotedev.heartbeat <= 0 or self.wiimotedev.heartbeat > heartbeat:
+				self.wiimotedev.setReportDeduplication(True, heartbeat)
 		self.create_uinput_dev()
 		
 		self.initialized = True
+		if self.deferred:
+			emitter.addDevice(self)
+		else:
+			emitter.delDevice(self)
+		# The new uinput device needs a full state update
+		self.wiimotedev.resetReportFilter()
+	
+	def compile_active_mapping(self):
+		# Everything the handlers precompute from self.mapping
+		self.plan = compile_mapping(self.mapping)
+		self.deadzones = compute_deadzones(self.mapping)
+		self.filters = compile_filters(self.mapping)
+		self.shakers = compile_shakers(self.mapping)
+		if self.filters != None:
+			# Filter state, 3 slots per input (see filter)
+			self.filterState = array.array('l', [0]*(3*len(self.filters)))
+			
+	def reset_output_state(self):
+		# Forget what was sent, so the next reports send the full state
+		self.lastKeyMask = None
+		self.lastExtMask = None
+		# (type, code) -> last value sent. Empty: send everything
+		self.lastValues = {}
+		self.isIdle = False
+		self.idleAxes = {}
+		self.lastActivity = libwiimote.monotonic()
+		with self.emitLock:
+			self.pending = {}
+			self.edge = False
+			self.deferred = emit_rate > 0
 	
 	def handler_keys(self, payload):
 		if not self.initialized or self.uinputdev == None:
 			return
 		if self.profile == PROFILE_WIIMOTE or self.profile == PROFILE_WIIMOTE_NUNCHUK:
-			btn_left, btn_right, btn_up, btn_down, btn_minus, btn_home, btn_plus, btn_a, btn_b, btn_1, btn_2 = libwiimote.WiiDataParser.parseWiimoteKeys(self.wiimotedev, payload)
-			pd = self.mapping.description
-			values = [False]*pd.SIZE
-			values[pd.BTN_A] = btn_a
-			values[pd.BTN_B] = btn_b
-			values[pd.BTN_1] = btn_1
-			values[pd.BTN_2] = btn_2
-			values[pd.BTN_LEFT] = btn_left
-			values[pd.BTN_RIGHT] = btn_right
-			values[pd.BTN_UP] = btn_up
-			values[pd.BTN_DOWN] = btn_down
-			values[pd.BTN_MINUS] = btn_minus
-			values[pd.BTN_HOME] = btn_home
-			values[pd.BTN_PLUS] = btn_plus
-			# Send events
-			index = -1
-			for v in values[:]:
-				index+=1
-				_map = self.mapping.mapping[index]
-				if _map == None:
-					continue
-				self.send_event(_map, v, pd.axis[index])
+			mask = self.wiimotedev.decoders.keymask(payload)
+			self.send_button_mask(mask, self.lastKeyMask, libwiimote.WiiButtonBits.WIIMOTE_MASK)
+			self.lastKeyMask = mask
+			
+	def send_button_mask(self, mask, lastmask, allbits):
+		# Send events for the buttons flipped since lastmask (all of them if
+		# there is no previous mask). Bits are mapping description indexes
+		changed = allbits if lastmask == None else mask ^ lastmask
+		if changed:
+			self.active = True
+		while changed:
+			bit = changed & -changed
+			changed ^= bit
+			self.send_input(bit.bit_length() - 1, mask & bit)
 	
 	def handler_accel(self, payload):
 		if not self.initialized or self.uinputdev == None:
 			return
 		if self.profile == PROFILE_WIIMOTE or self.profile == PROFILE_WIIMOTE_NUNCHUK:
-			x, y, z = libwiimote.WiiDataParser.parseWiimoteAccel(self.wiimotedev, payload)
+			x, y, z = self.wiimotedev.decoders.accel(payload)
 			y = -y
 			pd = self.mapping.description
+			# BTN_SHAKE, from the unfiltered values
+			shaker = self.shakers.get(pd.BTN_SHAKE)
+			if shaker != None:
+				self.send_input(pd.BTN_SHAKE, shaker.update(x, y, z))
+			if self.filters != None:
+				x = self.filter(pd.ACCEL_X, x)
+				y = self.filter(pd.ACCEL_Y, y)
+				z = self.filter(pd.ACCEL_Z, z)
+			if idle_timeout > 0:
+				self.axis_moved(pd.ACCEL_X, x, pd.abs_params[pd.ACCEL_X])
+				self.axis_moved(pd.ACCEL_Y, y, pd.abs_params[pd.ACCEL_Y])
+				self.axis_moved(pd.ACCEL_Z, z, pd.abs_params[pd.ACCEL_Z])
 			# ACCEL_X
-			_map = self.mapping.mapping[pd.ACCEL_X]
-			if _map != None:
-				if compute_single_deadzone(_map, pd.abs_params[pd.ACCEL_X].max, x):
-					x = 0
-				self.send_event(_map, x, pd.axis[pd.ACCEL_X], _abs=pd.abs_params[pd.ACCEL_X])
+			self.send_input(pd.ACCEL_X, x)
 			# ACCEL_Y (tilt left-right in horizontal)
-			_map = self.mapping.mapping[pd.ACCEL_Y]
-			if _map != None:
-				if compute_single_deadzone(_map, pd.abs_params[pd.ACCEL_Y].max, y):
-					y = 0
-				self.send_event(_map, y, pd.axis[pd.ACCEL_Y], _abs=pd.abs_params[pd.ACCEL_Y])
+			self.send_input(pd.ACCEL_Y, y)
 			# ACCEL_Z
-			_map = self.mapping.mapping[pd.ACCEL_Z]
-			if _map != None:
-				if compute_single_deadzone(_map, pd.abs_params[pd.ACCEL_Z].max, z):
-					z = 0
-				self.send_event(_map, z, pd.axis[pd.ACCEL_Z], _abs=pd.abs_params[pd.ACCEL_Z])
-				
-			# BTN_SHAKE
-			_map = self.mapping.mapping[pd.BTN_SHAKE]
-			if _map != None:
-				_sens = 260
-				if isinstance(_map, mapping.ButtonMapping) and _map.sensitivity > 0:
-					_sens = _map.sensitivity
-				val = 1 if (z < -_sens or z > _sens) else 0
-				self.send_event(_map, val, pd.axis[pd.BTN_SHAKE])
+			self.send_input(pd.ACCEL_Z, z)
 		
 	def handler_ext(self, payload):
 		if not self.initialized or self.uinputdev == None:
 			return
 		# Check extension first
+		parseExt = self.wiimotedev.decoders.extmask
+		if parseExt == None:
+			return
 		pd = self.mapping.description
 		values = {}
+		# Axes whose moves do not count as activity
+		quiet = ()
 		if self.profile == PROFILE_PRO_CONTROLLER:
-			lx, ly, rx, ry, btn_left, btn_right, btn_up, btn_down, btn_minus, btn_home, btn_plus, btn_a, btn_b, btn_x, btn_y, btn_tl, btn_tr, btn_zl, btn_zr, btn_thumbl, btn_thumbr = libwiimote.WiiDataParser.parseProController(self.wiimotedev, payload)		
-			values[pd.BTN_A] = btn_a
-			values[pd.BTN_B] = btn_b
-			values[pd.BTN_X] = btn_x
-			values[pd.BTN_Y] = btn_y
-			values[pd.BTN_LEFT] = btn_left
-			values[pd.BTN_RIGHT] = btn_right
-			values[pd.BTN_UP] = btn_up
-			values[pd.BTN_DOWN] = btn_down
-			values[pd.BTN_MINUS] = btn_minus
-			values[pd.BTN_HOME] = btn_home
-			values[pd.BTN_PLUS] = btn_plus
-			values[pd.BTN_TL] = btn_tl
-			values[pd.BTN_TR] = btn_tr
-			values[pd.BTN_ZL] = btn_zl
-			values[pd.BTN_ZR] = btn_zr
+			lx, ly, rx, ry, buttons = parseExt(payload)
+			self.send_button_mask(buttons, self.lastExtMask, libwiimote.WiiButtonBits.PRO_MASK)
+			self.lastExtMask = buttons
 			values[pd.AXIS_X] = lx
 			values[pd.AXIS_Y] = ly
 			values[pd.AXIS_RX] = rx
 			values[pd.AXIS_RY] = ry
-			values[pd.BTN_THUMBL] = btn_thumbl
-			values[pd.BTN_THUMBR] = btn_thumbr
-			
-			# Compute PRO controller dead zones
-			in_dz = compute_deadzone(self.mapping.mapping[pd.AXIS_X], self.mapping.mapping[pd.AXIS_Y], 
-							pd.abs_params[pd.AXIS_X].max, pd.abs_params[pd.AXIS_Y].max, lx, ly)
-			if in_dz:
-				lx = 0
-				ly = 0
-				values[pd.AXIS_X] = lx
-				values[pd.AXIS_Y] = ly
-				
-			in_dz = compute_deadzone(self.mapping.mapping[pd.AXIS_RX], self.mapping.mapping[pd.AXIS_RY], 
-							pd.abs_params[pd.AXIS_RX].max, pd.abs_params[pd.AXIS_RY].max, rx, ry)
-			if in_dz:
-				rx = 0
-				ry = 0
-				values[pd.AXIS_RX] = rx
-				values[pd.AXIS_RY] = ry
 			
 		elif self.profile == PROFILE_CLASSIC_CONTROLLER:
-			lx, ly, rx, ry, lt, rt, btn_left, btn_right, btn_up, btn_down, btn_minus, btn_home, btn_plus, btn_a, btn_b, btn_x, btn_y, btn_lt, btn_rt, btn_zl, btn_zr = libwiimote.WiiDataParser.parseClassic(self.wiimotedev, payload)
-			values[pd.BTN_A] = btn_a
-			values[pd.BTN_B] = btn_b
-			values[pd.BTN_X] = btn_x
-			values[pd.BTN_Y] = btn_y
-			values[pd.BTN_LEFT] = btn_left
-			values[pd.BTN_RIGHT] = btn_right
-			values[pd.BTN_UP] = btn_up
-			values[pd.BTN_DOWN] = btn_down
-			values[pd.BTN_MINUS] = btn_minus
-			values[pd.BTN_HOME] = btn_home
-			values[pd.BTN_PLUS] = btn_plus
-			values[pd.BTN_TL] = btn_lt
-			values[pd.BTN_TR] = btn_rt
-			values[pd.BTN_ZL] = btn_zl
-			values[pd.BTN_ZR] = btn_zr
+			lx, ly, rx, ry, lt, rt, buttons = parseExt(payload)
+			self.send_button_mask(buttons, self.lastExtMask, libwiimote.WiiButtonBits.CLASSIC_MASK)
+			self.lastExtMask = buttons
 			values[pd.AXIS_X] = lx
 			values[pd.AXIS_Y] = ly
 			values[pd.AXIS_RX] = rx
 			values[pd.AXIS_RY] = ry
 			values[pd.AXIS_LT] = lt
 			values[pd.AXIS_RT] = rt
-			# Compute classic controller dead zones
-			in_dz = compute_deadzone(self.mapping.mapping[pd.AXIS_X], self.mapping.mapping[pd.AXIS_Y], 
-							pd.abs_params[pd.AXIS_X].max, pd.abs_params[pd.AXIS_Y].max, lx, ly)
-			if in_dz:
-				lx = 0
-				ly = 0
-				values[pd.AXIS_X] = lx
-				values[pd.AXIS_Y] = ly
-				
-			in_dz = compute_deadzone(self.mapping.mapping[pd.AXIS_RX], self.mapping.mapping[pd.AXIS_RY], 
-							pd.abs_params[pd.AXIS_RX].max, pd.abs_params[pd.AXIS_RY].max, rx, ry)
-			if in_dz:
-				rx = 0
-				ry = 0
-				values[pd.AXIS_RX] = rx
-				values[pd.AXIS_RY] = ry
 			
 		elif self.profile == PROFILE_WIIMOTE_NUNCHUK:
-			bx, by, x, y, z, btn_c, btn_z = libwiimote.WiiDataParser.parseNunchuk(self.wiimotedev, payload)
-			values[pd.BTN_Z] = btn_z
-			values[pd.BTN_C] = btn_c
+			bx, by, x, y, z, buttons = parseExt(payload)
+			self.send_button_mask(buttons, self.lastExtMask, libwiimote.WiiButtonBits.NUNCHUK_MASK)
+			self.lastExtMask = buttons
 			values[pd.AXIS_X] = bx
 			values[pd.AXIS_Y] = by
 			values[pd.ACCEL_NX] = x
 			values[pd.ACCEL_NY] = y
 			values[pd.ACCEL_NZ] = z
+			if self.isIdle:
+				# Accelerometer noise would wake the device all the time: only
+				# the buttons and the stick wake it
+				quiet = (pd.ACCEL_NX, pd.ACCEL_NY, pd.ACCEL_NZ)
 			# BTN_NSHAKE
-			_map = self.mapping.mapping[pd.BTN_NSHAKE]
-			if _map != None:
-				_sens = 260
-				if isinstance(_map, mapping.ButtonMapping) and _map.sensitivity > 0:
-					_sens = _map.sensitivity
-				val = 1 if (z < -_sens or z > _sens) else 0
-				self.send_event(_map, val, pd.axis[pd.BTN_NSHAKE])
-			# Compute nunchuk dead zone
-			in_dz = compute_deadzone(self.mapping.mapping[pd.AXIS_X], self.mapping.mapping[pd.AXIS_Y], 
-							pd.abs_params[pd.AXIS_X].max, pd.abs_params[pd.AXIS_Y].max, bx, by)
-			if in_dz:
-				bx = 0
-				by = 0
-				values[pd.AXIS_X] = bx
-				values[pd.AXIS_Y] = by
+			shaker = self.shakers.get(pd.BTN_NSHAKE)
+			if shaker != None:
+				self.send_input(pd.BTN_NSHAKE, shaker.update(x, y, z))
+			
+		# Filter, then compute the stick dead zones
+		if self.filters != None:
+			for index, v in values.items():
+				values[index] = self.filter(index, v)
+		for ix, iy in pd.stick_pairs:
+			if ix in values and self.in_deadzone(ix, values[ix], values[iy]):
+				values[ix] = 0
+				values[iy] = 0
 			
 		# Send events
-		for k in values.keys():
-			index = k
-			v = values[k]
-			_map = self.mapping.mapping[index]
-			if _map == None:
+		plan = self.plan
+		for index, v in values.items():
+			if plan[index] == None:
 				continue
-			_abs = None
-			if pd.axis[index]:
-				_abs = pd.abs_params[index]
-			self.send_event(_map, v, pd.axis[index], _abs=_abs)
+			if idle_timeout > 0 and pd.axis[index] and not index in quiet:
+				self.axis_moved(index, v, pd.abs_params[index])
+			self.send_input(index, v)
 	
 	def handler_sync(self):
 		if not self.initialized or self.uinputdev == None:
 			return
-		self.uinputdev.send_sync()
+		if self.deferred:
+			# Values wait for the emitter, unless a button changed
+			if self.edge:
+				self.flush()
+		else:
+			# Commit the events of this report with a single write, stamped
+			# with its receive time, and start the frame of the next one.
+			# Reports that changed nothing send no empty SYN_REPORT
+			with self.emitLock:
+				if self.uinputdev.frame_len > 0:
+					self.uinputdev.commit_frame(self.wiimotedev.rxtime)
+					self.uinputdev.begin_frame()
+		if idle_timeout > 0:
+			self.check_idle()
+			
+	def axis_moved(self, index, value, _abs):
+		# Values inside the dead zone are already 0, so only real moves count
+		ref = self.idleAxes.get(index)
+		if ref == None or abs(value - ref) > _abs.max * IDLE_AXIS_DELTA:
+			self.idleAxes[index] = value
+			self.active = True
+			
+	def check_idle(self):
+		now = libwiimote.monotonic()
+		if self.active:
+			self.active = False
+			self.lastActivity = now
+			if self.isIdle:
+				self.isIdle = False
+				self.idleWakeups += 1
+				logging.debug("UINPUT: %s active" % self.address)
+				self.update_data_sources()
+				self.notify_idle()
+		elif not self.isIdle and now - self.lastActivity >= idle_timeout:
+			self.isIdle = True
+			self.idleDownshifts += 1
+			logging.debug("UINPUT: %s idle" % self.address)
+			# Keep only the reports that can wake the device up: core buttons,
+			# plus extension data whenever extension inputs are mapped (all
+			# the buttons of classic and Pro controllers, nunchuk buttons and
+			# stick). The nunchuk accelerometer is in the extension data, and
+			# its noise keeps a nunchuk reporting almost as often as when
+			# active: idle mode saves little radio traffic there
+			pd = self.mapping.description
+			self.wiimotedev.setDataSources(False, self.mapping.usesInputs(pd.ext_inputs), False)
+			self.notify_idle()
+			
+	def notify_idle(self):
+		if self.idleCallback != None:
+			self.idleCallback(self, self.isIdle)
 	
-	def send_event(self, _map, value, isNaturalAxis, _abs=None):
-		if _map._type == uinputdefs.EV_ABS and not isNaturalAxis:
-			# Axis emulation with button
-			ev = getevent(_map._type, _map._code[0], 1 if value else -1)
-		elif _map._type == uinputdefs.EV_KEY and isNaturalAxis:
-			# Button emulation with axis
-			_sens = 30
-			if isinstance(_map, mapping.ButtonMapping) and _map.sensitivity != None:
-				_sens = _map.sensitivity
-			ev = getevent(_map._type, _map._code[0], 1 if value>_sens else 0)
-		elif isNaturalAxis:
-			# Axis - Axis
-			if isinstance(_map, mapping.AxisMapping) and _abs != None:
-				# Apply axis inversion
-				if _map.isInverted:
-					value = -value
-				# Apply axis scale
-				if _map.sourceScale != None and _map.sourceScale > 0 and _abs != None:
-					_max = _abs.max
-					_scalef = _max / float(_map.sourceScale)
-					value = int(_scalef*value)
-				# Apply 1 axis to 2 axis
-				if len(_map._code) >= 2 and value > 0:
-					ev = getevent(_map._type, _map._code[1], value-(_abs.max/2))
-					self.uinputdev.send_event(ev)
-					ev = getevent(_map._type, _map._code[0], _abs.min)
-					self.uinputdev.send_event(ev)
-					return
-				elif len(_map._code) >= 2 and value < 0:
-					ev = getevent(_map._type, _map._code[0], (-value)-(_abs.max/2))
-					self.uinputdev.send_event(ev)
-					ev = getevent(_map._type, _map._code[1], _abs.min)
-					self.uinputdev.send_event(ev)
-					return
-				elif len(_map._code) >= 2 and value == 0:
-					ev = getevent(_map._type, _map._code[0], _abs.min)
-					self.uinputdev.send_event(ev)
-					ev = getevent(_map._type, _map._code[1], _abs.min)
-					self.uinputdev.send_event(ev)
-					return
-			ev = getevent(_map._type, _map._code[0], value)
+	def filter(self, index, value):
+		# Filtered value of a source input, in integer arithmetic. The state
+		# of each input is 3 slots of filterState: the filtered value in
+		# 1/256 units, the speed in 1/256 units (1 euro) or the last 2 values
+		# (median), and whether the input has a value yet
+		f = self.filters[index]
+		if f == None:
+			return value
+		kind, p0, p1, _max = f
+		state = self.filterState
+		i = 3*index
+		if state[i+2] == 0:
+			state[i+2] = 1
+			if kind == mapping.FILTER_MEDIAN:
+				state[i] = value
+				state[i+1] = value
+			else:
+				state[i] = value << 8
+				state[i+1] = 0
+			return value
+		if kind == mapping.FILTER_MEDIAN:
+			a = state[i]
+			b = state[i+1]
+			state[i] = b
+			state[i+1] = value
+			if a > b:
+				a, b = b, a
+			if value < a:
+				return a
+			if value > b:
+				return b
+			return value
+		y = state[i]
+		d = (value << 8) - y
+		if kind == mapping.FILTER_EURO:
+			# The faster the input moves, the less it is smoothed
+			speed = state[i+1]
+			speed += (EURO_SPEED_ALPHA * ((d if d >= 0 else -d) - speed)) >> 8
+			state[i+1] = speed
+			p0 += p1 * speed // _max
+			if p0 > 256:
+				p0 = 256
+		y += (p0 * d) >> 8
+		state[i] = y
+		return (y + 128) >> 8
+		
+	def in_deadzone(self, index, x, y):
+		# Radial dead zone of the stick pair whose x axis is index
+		rows = self.deadzones[index]
+		if rows == None:
+			return False
+		x = abs(x)
+		return x < len(rows) and abs(y) < rows[x]
+		
+	def send_input(self, index, value):
+		step = self.plan[index]
+		if step == None:
+			return
+		op, typ, code0, code1, offset, table, arg, transform = step
+		if op == OP_AXIS or op == OP_AXIS_SPLIT:
+			i = value + offset
+			if i >= 0 and i < len(table):
+				value = table[i]
+			else:
+				value = transform(value)
+			if op == OP_AXIS:
+				self.emit(typ, code0, value, arg)
+			else:
+				self.emit(typ, value[0][0], value[0][1], arg)
+				self.emit(typ, value[1][0], value[1][1], arg)
+		elif op == OP_BUTTON:
+			self.emit(typ, code0, 1 if value else 0, None, True)
+		elif op == OP_AXIS_BUTTON:
+			self.emit(typ, code0, 1 if value>arg else 0, None, True)
+		elif op == OP_BUTTON_AXIS:
+			self.emit(typ, code0, 1 if value else -1, None, True)
+		else:
+			self.emit(typ, code0, value, arg)
+			
+	def emit(self, typ, code, value, _abs=None, button=False):
+		if self.deferred:
+			# Keep the latest value until the next flush. A button state
+			# changing is flushed now: a button of the device, whatever it is
+			# mapped to, or an axis crossing its button threshold
+			key = (typ, code)
+			with self.emitLock:
+				self.pending[key] = (value, _abs)
+			if button and self.lastValues.get(key) != value:
+				self.edge = True
+			return
+		self.send_value(typ, code, value, _abs)
+		
+	def flush(self):
+		# Send the pending values as one frame, stamped with the receive time
+		# of the latest report
+		with self.emitLock:
+			self.edge = False
+			if len(self.pending) <= 0 or not self.initialized or self.uinputdev == None:
+				return
+			pending = self.pending
+			self.pending = {}
+			for key, v in pending.items():
+				self.send_value(key[0], key[1], v[0], v[1])
+			if self.uinputdev.frame_len > 0:
+				self.uinputdev.commit_frame(self.wiimotedev.rxtime)
+				self.uinputdev.begin_frame()
+			
+	def updateEmitRate(self):
+		# Follow a setEmitRate change. Going back to sending each report as
+		# it comes, the values still pending are sent first
+		if not self.initialized or self.deferred == (emit_rate > 0):
+			return
+		if emit_rate > 0:
+			with self.emitLock:
+				self.deferred = True
+			emitter.addDevice(self)
 		else:
-			# Button - Button
-			ev = getevent(_map._type, _map._code[0], 1 if value else 0)
-		self.uinputdev.send_event(ev)
+			emitter.delDevice(self)
+			with self.emitLock:
+				self.deferred = False
+			self.flush()
+			
+	def send_value(self, typ, code, value, _abs=None):
+		# Send only values that changed since the last event with this code.
+		# For axes, changes smaller than the axis fuzz are dropped too, unless
+		# the axis gets back to its center or reaches a limit
+		key = (typ, code)
+		last = self.lastValues.get(key)
+		if last != None:
+			if value == last:
+				return
+			if _abs != None and abs(value - last) < _abs.fuzz and value != 0 and value != _abs.min and value != _abs.max:
+				return
+		self.lastValues[key] = value
+		self.uinputdev.write_event(typ, code, value)
 	
 	def extension_change(self):
 		if not self.initialized:
@@ -386,12 +798,14 @@ class UInputWiimote():
 			return
 		logging.debug("UINPUT: Disconnected!!")
 		print(self.prettyName+" disconnected (player %d)."%self.led)
+		emitter.delDevice(self)
 		self.uinputdev.__del__()
 		if self.disconnectCallback != None:
 			self.disconnectCallback(self)
 		
 	def disconnect(self):
 		self.wiimotedev.disconnect(block=True)
+		emitter.delDevice(self)
 		self.uinputdev.__del__()
 		
 	def update_profile_status(self):
@@ -414,12 +828,22 @@ class UInputWiimote():
 		elif self.wiimotedev.hasClassicController() or self.wiimotedev.hasClassicControllerPro():
 			self.uinput_name = "Nintendo Wii Remote Classic Controller"
 			self.profile = PROFILE_CLASSIC_CONTROLLER
-			
-		# Enable wiimote accelerometer and/or extension
-		if self.profile == PROFILE_WIIMOTE or self.profile == PROFILE_WIIMOTE_NUNCHUK:
-			self.wiimotedev.enableAccel()
-		if self.profile == PROFILE_PRO_CONTROLLER or self.profile == PROFILE_CLASSIC_CONTROLLER or self.profile == PROFILE_WIIMOTE_NUNCHUK or self.profile == PROFILE_BALANCE_BOARD:
-			self.wiimotedev.enableExtension()
+		
+	def update_data_sources(self):
+		# Enable wiimote accelerometer and/or extension only if the mapping
+		# uses them, so the remote sends the smallest report that covers it
+		pd = self.mapping.description
+		accel = self.mapping.usesInputs(pd.accel_inputs)
+		ext = self.mapping.usesInputs(pd.ext_inputs)
+		continuous = not change_only_reports or self.mapping.usesInputs(pd.analog_inputs)
+		self.wiimotedev.setDataSources(accel, ext, continuous)
+		
+	def setMappingProfile(self, mappingProfile):
+		self.mappingProfile = mappingProfile
+		if self.initialized:
+			self.uinputdev.__del__()
+			self.initialized = False
+		self.initializeDevice()
 		
 	def create_uinput_dev(self):
 		self.uinputextension = self.wiimotedev.state.extension
@@ -467,6 +891,7 @@ class UInputWiimote():
 				self.uinputdev.set_absprops(_code[1], _abs.max/2, _abs.min/2, _abs.fuzz, _abs.flat)
 	
 		self.uinputdev.setup()
+		self.uinputdev.begin_frame()
 
 
 # MAIN (for testing purposes)
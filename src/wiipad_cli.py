@@ -35,6 +35,9 @@ def print_help():
 	print("wiipad_cli.py [options]")
 	print("-m <mapping file> (define mapping file to use)")
 	print("-s (enable continuous device scanning)")
+	print("-c (report only on changes when the mapping has no analog inputs)")
+	print("-i <seconds> (reduce the report mode of devices idle for this time)")
+	print("-r <hz> (send analog changes at this rate, buttons right away)")
 	print("-h (print this help message)")
 
 if __name__ == "__main__":
@@ -43,7 +46,7 @@ if __name__ == "__main__":
 		mapfile = None
 		continuous = False
 		try:
-			opts, args = getopt.getopt(sys.argv[1:],"hsm:d",["mapfile="])
+			opts, args = getopt.getopt(sys.argv[1:],"hsm:dci:r:",["mapfile="])
 		except getopt.GetoptError:
 			print_help()
 			sys.exit(2)
@@ -55,6 +58,12 @@ if __name__ == "__main__":
 				mapfile = arg
 			elif opt in ("-s",):
 				continuous = True
+			elif opt in ("-c",):
+				ctrlmanager.setChangeOnlyReports(True)
+			elif opt in ("-i",):
+				ctrlmanager.setIdleTimeout(float(arg))
+			elif opt in ("-r",):
+				ctrlmanager.setEmitRate(float(arg))
 			elif opt in ("-d",):
 				logging.basicConfig(level=logging.DEBUG)
 				
@@ -128,6 +128,9 @@ class WiiControllersIndicator():
 		self.refreshDeviceList()
 		pass
 		
+	def onDeviceIdleChanged(self, device, idle):
+		pass
+		
 	def refreshDeviceList(self):
 		menu = Gtk.Menu()
 		devices = ctrlmanager.getDeviceList()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Synchronous commands with dropped replies: retries, timeouts and
+# cancellation (see WiiDevice.setCommandTimeout)
+import threading
+import time
+import unittest
+
+import wiitestutils
+from wiitestutils import FakeRemote
+
+import libwiimote
+from libwiimote import WiiDevExtension
+
+def nop(*args):
+	pass
+
+TIMEOUT = 0.1
+
+class TestCommandTimeouts(unittest.TestCase):
+	def setUp(self):
+		self.remotes = []
+		self.devices = []
+		
+	def tearDown(self):
+		for d in self.devices:
+			d.disconnect(block=True)
+		for r in self.remotes:
+			r.close()
+		libwiimote.disconnect()
+		
+	def device(self, ext=None, drop=0):
+		r = FakeRemote("00:00:00:00:10:%02x" % len(self.remotes), ext=ext, drop=drop)
+		d = libwiimote.WiiDevice(r.address, r.name, nop, nop, nop, nop)
+		d.setCommandTimeout(TIMEOUT)
+		self.remotes.append(r)
+		self.devices.append(d)
+		return r, d
+		
+	def drop_first_reply(self, remote, code):
+		# Returns the list the dropped reply is added to
+		out = remote.out
+		dropped = []
+		def drop(data):
+			if data[0] == code and len(dropped) == 0:
+				dropped.append(data)
+				return
+			out(data)
+		remote.out = drop
+		return dropped
+		
+	def test_dropped_status_reply_is_retried(self):
+		r, d = self.device(ext="nunchuk", drop=1)
+		d.connect()
+		self.assertEqual(d.state.extension, WiiDevExtension.WIIMOTE_EXT_NUNCHUK)
+		self.assertEqual(d.commandTimeouts, 1)
+		
+	def test_dropped_read_reply_is_retried(self):
+		r, d = self.device(ext="nunchuk")
+		d.connect()
+		r.mem[0x0016] = list(range(20))
+		self.drop_first_reply(r, 0x21)
+		self.assertEqual(list(d.wiiproto_cmd_rmem(0x0016, 20, eeprom=True)), list(range(20)))
+		self.assertEqual(d.commandTimeouts, 1)
+		self.assertEqual(len(d.mem_requests), 0)
+		
+	def test_dropped_write_ack_during_detection(self):
+		r, d = self.device(ext="classic")
+		dropped = self.drop_first_reply(r, 0x22)
+		d.connect()
+		self.assertEqual(len(dropped), 1)
+		self.assertEqual(d.state.extension, WiiDevExtension.WIIMOTE_EXT_CLASSIC_CONTROLLER)
+		self.assertEqual(len(d.mem_requests), 0)
+		
+	def test_dead_remote_raises_timeout(self):
+		r, d = self.device(drop=100)
+		start = time.time()
+		self.assertRaises(libwiimote.WiiTimeoutError, d.connect)
+		self.assertTrue(d.isDisconnected)
+		self.assertEqual(d.commandTimeouts, d.commandRetries + 1)
+		# 0.1 + 0.2 + 0.4 s with the default backoff
+		self.assertLess(time.time() - start, 2.0)
+		
+	def test_disconnect_cancels_pending_read(self):
+		r, d = self.device(ext="nunchuk")
+		d.connect()
+		d.setCommandTimeout(5.0)
+		r.drop = 100
+		result = []
+		t = threading.Thread(target=lambda: result.append(d.wiiproto_cmd_rmem(0xa400fa, 6)))
+		t.start()
+		time.sleep(0.1)
+		start = time.time()
+		d.disconnect(block=True)
+		t.join(5.0)
+		self.assertFalse(t.is_alive())
+		self.assertLess(time.time() - start, 1.0)
+		self.assertEqual(len(d.mem_requests), 0)
+		
+	def test_status_of_disconnected_device_fails_fast(self):
+		r, d = self.device(ext="nunchuk")
+		d.connect()
+		d.setCommandTimeout(5.0)
+		d.disconnect(block=True)
+		start = time.time()
+		self.assertEqual(d.wiiproto_req_status(), [])
+		self.assertLess(time.time() - start, 1.0)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Rate-decoupled output (see wiimote_uinput_glue.setEmitRate): which changes
+# are sent right away, and switching the rate of a device already created
+import unittest
+
+import wiitestutils
+
+import fileutils
+import uinputdefs
+import wiimote_uinput_glue
+
+class TestEmitRate(unittest.TestCase):
+	def setUp(self):
+		profile = fileutils.readMappingFromFile(wiitestutils.EXAMPLE_MAPPING)
+		w = wiitestutils.createGlueDevice(wiimote_uinput_glue.PROFILE_PRO_CONTROLLER, profile.proMapping, wiitestutils.createProController(), wiitestutils.RecordingUInputDevice())
+		w.deferred = True
+		self.w = w
+		self.rate = wiimote_uinput_glue.emit_rate
+		
+	def tearDown(self):
+		wiimote_uinput_glue.emitter.delDevice(self.w)
+		wiimote_uinput_glue.setEmitRate(self.rate)
+		
+	def findStep(self, op):
+		for index, step in enumerate(self.w.plan):
+			if step != None and step[0] == op:
+				return index
+		
+	def testButtonToAxisIsSentNow(self):
+		index = self.findStep(wiimote_uinput_glue.OP_BUTTON)
+		self.w.plan[index] = (wiimote_uinput_glue.OP_BUTTON_AXIS, uinputdefs.EV_ABS, uinputdefs.ABS_RZ, None, 0, None, None, None)
+		self.w.send_input(index, 1)
+		self.assertTrue(self.w.edge)
+		self.w.flush()
+		self.w.edge = False
+		self.w.send_input(index, 1)
+		self.assertFalse(self.w.edge)
+		
+	def testAxisToButtonIsSentNow(self):
+		index = self.findStep(wiimote_uinput_glue.OP_AXIS)
+		self.w.plan[index] = (wiimote_uinput_glue.OP_AXIS_BUTTON, uinputdefs.EV_KEY, uinputdefs.BTN_TL, None, 0, None, 30, None)
+		self.w.send_input(index, 100)
+		self.assertTrue(self.w.edge)
+		self.w.flush()
+		self.w.edge = False
+		# Still pressed
+		self.w.send_input(index, 80)
+		self.assertFalse(self.w.edge)
+		self.w.send_input(index, 10)
+		self.assertTrue(self.w.edge)
+		
+	def testAxisWaits(self):
+		index = self.findStep(wiimote_uinput_glue.OP_AXIS)
+		self.w.send_input(index, 100)
+		self.assertFalse(self.w.edge)
+		self.assertNotEqual(self.w.pending, {})
+		
+	def testSwitchToImmediateSendsPending(self):
+		wiimote_uinput_glue.setEmitRate(0)
+		self.w.emit(uinputdefs.EV_ABS, uinputdefs.ABS_HAT0X, 1)
+		self.w.updateEmitRate()
+		self.assertFalse(self.w.deferred)
+		self.assertEqual(self.w.pending, {})
+		self.assertEqual(self.w.uinputdev.frames, [[(uinputdefs.EV_ABS, uinputdefs.ABS_HAT0X, 1)]])
+		
+	def testSwitchToDeferred(self):
+		self.w.deferred = False
+		wiimote_uinput_glue.setEmitRate(60)
+		self.w.updateEmitRate()
+		self.assertTrue(self.w.deferred)
+		self.assertTrue(self.w in wiimote_uinput_glue.emitter.devices)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Compiled mapping plans (see wiimote_uinput_glue.compile_mapping): the
+# values sent through send_input
+import unittest
+
+import wiitestutils
+
+import mapping
+import uinputdefs
+import wiimote_uinput_glue
+
+class TestMappingPlan(unittest.TestCase):
+	def createDevice(self, index, _map):
+		pd = mapping.ProControllerDescription()
+		_mapping = mapping.Mapping(pd, isGamepad=True)
+		_mapping.setMap(index, _map)
+		uinputdev = wiitestutils.RecordingUInputDevice()
+		w = wiitestutils.createGlueDevice(wiimote_uinput_glue.PROFILE_PRO_CONTROLLER, _mapping, wiitestutils.createProController(), uinputdev)
+		w.deferred = False
+		return w, uinputdev
+		
+	def testSplitAxis(self):
+		pd = mapping.ProControllerDescription()
+		w, uinputdev = self.createDevice(pd.AXIS_RX, mapping.AxisMapping([uinputdefs.ABS_Z, uinputdefs.ABS_RZ]))
+		_abs = pd.abs_params[pd.AXIS_RX]
+		self.assertEqual(w.plan[pd.AXIS_RX][0], wiimote_uinput_glue.OP_AXIS_SPLIT)
+		for value in (_abs.max, -_abs.max, 0, _abs.max*(wiimote_uinput_glue.AXIS_LUT_RANGE + 1)):
+			w.send_input(pd.AXIS_RX, value)
+			w.uinputdev.commit_frame()
+		half = _abs.max//2
+		self.assertEqual(uinputdev.frames, [
+			[(uinputdefs.EV_ABS, uinputdefs.ABS_RZ, _abs.max - half), (uinputdefs.EV_ABS, uinputdefs.ABS_Z, _abs.min)],
+			[(uinputdefs.EV_ABS, uinputdefs.ABS_Z, _abs.max - half), (uinputdefs.EV_ABS, uinputdefs.ABS_RZ, _abs.min)],
+			[(uinputdefs.EV_ABS, uinputdefs.ABS_Z, _abs.min)],
+			# Out of the lookup table. ABS_Z is already at its minimum
+			[(uinputdefs.EV_ABS, uinputdefs.ABS_RZ, _abs.max*(wiimote_uinput_glue.AXIS_LUT_RANGE + 1) - half)],
+		])
+		for frame in uinputdev.frames:
+			for typ, code, value in frame:
+				self.assertTrue(isinstance(value, int))
+
+if __name__ == "__main__":
+	unittest.main()
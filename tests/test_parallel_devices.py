@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Several devices connecting and reading memory at the same time must not
+# see each other's replies
+import threading
+import unittest
+
+import wiitestutils
+from wiitestutils import FakeRemote
+
+import libwiimote
+from libwiimote import WiiDevExtension
+
+def nop(*args):
+	pass
+
+DEVICES = [
+	("nunchuk", "Nintendo RVL-CNT-01", WiiDevExtension.WIIMOTE_EXT_NUNCHUK),
+	("classic", "Nintendo RVL-CNT-01", WiiDevExtension.WIIMOTE_EXT_CLASSIC_CONTROLLER),
+	("pro", "Nintendo RVL-CNT-01-UC", WiiDevExtension.WIIMOTE_EXT_PRO_CONTROLLER),
+	(None, "Nintendo RVL-CNT-01", WiiDevExtension.WIIMOTE_EXT_NONE),
+]
+MEM_ADDRESS = 0x0016
+
+class TestParallelDevices(unittest.TestCase):
+	def setUp(self):
+		self.remotes = []
+		self.devices = []
+		for i, (ext, name, expected) in enumerate(DEVICES):
+			# Slow replies, so the requests of all devices overlap
+			r = FakeRemote("00:00:00:00:08:%02x" % i, name=name, ext=ext, delay=0.02)
+			# Memory contents unique to each remote
+			r.mem[MEM_ADDRESS] = [(i*40 + j) & 0xff for j in range(40)]
+			self.remotes.append(r)
+			self.devices.append(libwiimote.WiiDevice(r.address, r.name, nop, nop, nop, nop))
+			
+	def tearDown(self):
+		for d in self.devices:
+			d.disconnect(block=True)
+		for r in self.remotes:
+			r.close()
+		libwiimote.disconnect()
+		
+	def run_parallel(self, target):
+		errors = []
+		def run(i):
+			try:
+				target(i)
+			except Exception as e:
+				errors.append(e)
+		threads = [threading.Thread(target=run, args=(i,)) for i in range(len(self.devices))]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join(10)
+		self.assertEqual(errors, [])
+		
+	def test_parallel_extension_detection(self):
+		self.run_parallel(lambda i: self.devices[i].connect())
+		for d, (ext, name, expected) in zip(self.devices, DEVICES):
+			self.assertEqual(d.state.extension, expected)
+			self.assertFalse(d.isDisconnected)
+		# Every remote got its own status request, and an extension read if
+		# it has an extension
+		for r in self.remotes:
+			codes = [d[0] for d in r.received]
+			self.assertIn(0x15, codes)
+			self.assertEqual(0x17 in codes, r.ext != None)
+			
+	def test_parallel_synchronous_reads(self):
+		self.run_parallel(lambda i: self.devices[i].connect())
+		results = {}
+		def read(i):
+			for n in range(3):
+				results[(i, n)] = list(self.devices[i].wiiproto_cmd_rmem(MEM_ADDRESS, 40, eeprom=True))
+		self.run_parallel(read)
+		for (i, n), value in results.items():
+			self.assertEqual(value, self.remotes[i].mem[MEM_ADDRESS])
+			
+	def test_parallel_futures(self):
+		self.run_parallel(lambda i: self.devices[i].connect())
+		# Interleave pipelined requests of all devices
+		futures = []
+		for n in range(4):
+			for i, d in enumerate(self.devices):
+				futures.append((i, d.wiiproto_cmd_rmem_async(MEM_ADDRESS, 40, eeprom=True)))
+		for i, f in futures:
+			self.assertEqual(list(f.result()), self.remotes[i].mem[MEM_ADDRESS])
+		for d in self.devices:
+			self.assertEqual(len(d.mem_requests), 0)
+
+if __name__ == "__main__":
+	unittest.main()
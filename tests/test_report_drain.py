@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Drain-and-coalesce receive mode (see libwiimote.setReportCoalescing): which
+# of the reports queued on a data socket are kept
+import socket
+import unittest
+
+import wiitestutils
+
+import libwiimote
+
+DRM_K = libwiimote.WiiProtoReqs.WIIPROTO_REQ_DRM_K
+
+def report(buttons):
+	# Core buttons report, A is bit 3 of the second byte
+	return bytes(bytearray([0xa1, DRM_K, 0x00, buttons]))
+
+class TestReportDrain(unittest.TestCase):
+	def setUp(self):
+		self.host, self.remote = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+		self.dev = libwiimote.WiiDevice("00:00:00:00:00:00", "Nintendo RVL-CNT-01", None, None, None, None)
+		self.dev.rbuf.bind(self.host)
+		self.receiver = libwiimote.WiiDeviceReceiver()
+		
+	def tearDown(self):
+		self.receiver.close()
+		self.host.close()
+		self.remote.close()
+		
+	def drain(self, reports):
+		for r in reports:
+			self.remote.send(r)
+		return [bytes(bytearray(x)) for x, rxtime in self.receiver.drainDataSocket(self.host.fileno(), self.dev)]
+		
+	def testContinuousStateIsCollapsed(self):
+		self.dev.continuousReports = True
+		self.assertEqual(self.drain([report(0)]*4), [report(0)])
+		self.assertEqual(self.dev.coalescedReports, 3)
+		
+	def testContinuousKeepsButtonChanges(self):
+		# A quick tap between unchanged reports
+		self.dev.continuousReports = True
+		drained = self.drain([report(0), report(0), report(0x08), report(0), report(0)])
+		self.assertEqual(drained, [report(0), report(0x08), report(0)])
+		
+	def testChangeOnlyKeepsEveryReport(self):
+		# Press and release read in one drain
+		self.dev.continuousReports = False
+		self.assertEqual(self.drain([report(0x08), report(0)]), [report(0x08), report(0)])
+		self.assertEqual(self.dev.coalescedReports, 0)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# WiiBatchParser must return exactly what WiiDataParser returns, report by
+# report, for random payloads
+import unittest
+
+import wiitestutils
+import numpy
+
+import libwiimote
+from libwiimote import WiiDataParser, WiiDevType, WiiProtoState
+from wiibatchparser import WiiBatchParser, reportPayloads
+
+ROWS = 4000
+
+class FakeDevice():
+	def __init__(self, device, flags=0):
+		self.state = libwiimote.WiiDeviceState()
+		self.state.device = device
+		self.state.flags = flags
+
+class TestWiiBatchParser(unittest.TestCase):
+	def setUp(self):
+		rng = numpy.random.RandomState(7)
+		self.rows = rng.randint(0, 256, size=(ROWS, 21)).astype(numpy.uint8)
+		
+	def scalar(self, parser, device):
+		return [tuple(parser(device, bytearray(r.tobytes()))) for r in self.rows]
+		
+	def test_wiimote_keys(self):
+		device = FakeDevice(WiiDevType.WIIMOTE_DEV_GEN20)
+		self.assertEqual(WiiBatchParser.parseWiimoteKeys(self.rows).tolist(), self.scalar(WiiDataParser.parseWiimoteKeys, device))
+		
+	def test_wiimote_accel(self):
+		for gen in (WiiDevType.WIIMOTE_DEV_GEN10, WiiDevType.WIIMOTE_DEV_GEN20):
+			device = FakeDevice(gen)
+			self.assertEqual(WiiBatchParser.parseWiimoteAccel(self.rows, gen).tolist(), self.scalar(WiiDataParser.parseWiimoteAccel, device))
+			
+	def test_nunchuk(self):
+		for mp in (False, True):
+			device = FakeDevice(WiiDevType.WIIMOTE_DEV_GEN20, WiiProtoState.FLAG_MP_ACTIVE if mp else 0)
+			self.assertEqual(WiiBatchParser.parseNunchuk(self.rows, mp).tolist(), self.scalar(WiiDataParser.parseNunchuk, device))
+			
+	def test_classic(self):
+		for mp in (False, True):
+			device = FakeDevice(WiiDevType.WIIMOTE_DEV_GEN20, WiiProtoState.FLAG_MP_ACTIVE if mp else 0)
+			self.assertEqual(WiiBatchParser.parseClassic(self.rows, mp).tolist(), self.scalar(WiiDataParser.parseClassic, device))
+			
+	def test_pro_controller(self):
+		# A first report near the center calibrates the sticks
+		self.rows[0, :8] = [0x10, 0x08, 0xf0, 0x07, 0x00, 0x08, 0x20, 0x08]
+		device = FakeDevice(WiiDevType.WIIMOTE_DEV_PRO_CONTROLLER)
+		self.assertEqual(WiiBatchParser.parseProController(self.rows).tolist(), self.scalar(WiiDataParser.parseProController, device))
+		
+	def test_pro_controller_calibration_array(self):
+		device = FakeDevice(WiiDevType.WIIMOTE_DEV_PRO_CONTROLLER)
+		device.state.flags |= WiiProtoState.FLAG_PRO_CALIB_DONE
+		device.state.calib_pro_sticks = [3, -5, 7, -11]
+		calib = numpy.array(device.state.calib_pro_sticks)
+		self.assertEqual(WiiBatchParser.parseProController(self.rows, calib).tolist(), self.scalar(WiiDataParser.parseProController, device))
+		
+	def test_report_payloads(self):
+		reports = [bytearray([0xa1, 0x34]) + bytearray(r.tobytes()) for r in self.rows[:10]]
+		reports.append(bytearray([0xa1, 0x20, 0, 0, 0, 0, 0, 0]))
+		self.assertTrue((reportPayloads(reports, 0x34, 2) == self.rows[:10, 2:]).all())
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+WiiPad, a simple user-space driver for Wii/WiiU controllers
+Copyright (C) 2014  Arturo Casal
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+# Shared test setup: puts src/ on the path and, where PyBluez is not
+# installed, provides a stand-in "bluetooth" module whose sockets connect to
+# in-process fake remotes (see FakeRemote)
+import os
+import socket
+import sys
+import threading
+import time
+import types
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+if not SRC in sys.path:
+	sys.path.insert(0, SRC)
+
+# address -> FakeRemote
+remotes = {}
+
+# Extension identifier bytes (0xa400fa) of the fake remotes
+EXTENSION_IDS = {
+	None: [0xff]*6,
+	"nunchuk": [0x00, 0x00, 0xa4, 0x20, 0x00, 0x00],
+	"classic": [0x00, 0x00, 0xa4, 0x20, 0x01, 0x01],
+	"pro": [0x00, 0x00, 0xa4, 0x20, 0x01, 0x20],
+}
+
+class FakeRemote(object):
+	# In-process Wii remote on the other end of a socketpair. It answers
+	# status requests, memory reads and writes, and streams payload in the
+	# requested report mode. The first drop requests get no reply, and
+	# replies are sent delay seconds late
+	def __init__(self, address, name="Nintendo RVL-CNT-01", ext=None, drop=0, delay=0, rate=0.01):
+		self.address = address
+		self.name = name
+		self.ext = ext
+		self.drop = drop
+		self.delay = delay
+		self.rate = rate
+		# address -> list of bytes
+		self.mem = {0xa400fa: EXTENSION_IDS[ext]}
+		self.drm = None
+		self.continuous = False
+		self.payload = None
+		# Output reports received, without the 0xa2 header
+		self.received = []
+		self.socks = {}
+		self.lock = threading.Lock()
+		self.running = True
+		remotes[address] = self
+		
+	def attach(self, psm):
+		a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+		self.socks[psm] = b
+		self.start(self.serve, b)
+		if psm == 19:
+			self.start(self.stream)
+		return a
+		
+	def start(self, target, *args):
+		t = threading.Thread(target=target, args=args)
+		t.daemon = True
+		t.start()
+		
+	def close(self):
+		self.running = False
+		for s in self.socks.values():
+			s.close()
+		remotes.pop(self.address, None)
+		
+	def out(self, data):
+		with self.lock:
+			try:
+				self.socks[19].send(bytes(bytearray([0xa1] + list(data))))
+			except (IOError, OSError, KeyError):
+				pass
+				
+	def reply(self, data):
+		if self.delay > 0:
+			time.sleep(self.delay)
+		self.out(data)
+		
+	def serve(self, s):
+		while self.running:
+			try:
+				d = s.recv(64)
+			except (IOError, OSError):
+				return
+			if not d:
+				return
+			d = list(bytearray(d))[1:]
+			self.received.append(d)
+			if self.drop > 0:
+				self.drop -= 1
+				continue
+			code = d[0]
+			if code == 0x15:
+				self.reply([0x20, 0, 0, 0x02 if self.ext else 0, 0, 0, 0xc0])
+			elif code == 0x17:
+				address = (d[2] << 16) | (d[3] << 8) | d[4]
+				length = (d[5] << 8) | d[6]
+				data = self.mem.get(address, [0]*length) + [0]*16
+				for offset in range(0, length, 16):
+					n = min(16, length - offset)
+					a = address + offset
+					self.reply([0x21, 0, 0, (n - 1) << 4, (a >> 8) & 0xff, a & 0xff] + data[offset:offset+16])
+			elif code == 0x16:
+				address = (d[2] << 16) | (d[3] << 8) | d[4]
+				self.mem[address] = d[6:6+d[5]]
+				self.reply([0x22, 0, 0, 0x16, 0])
+			elif code == 0x12:
+				self.continuous = bool(d[1] & 0x04)
+				self.drm = d[2]
+				
+	def stream(self):
+		while self.running:
+			time.sleep(self.rate)
+			if self.drm and self.continuous:
+				payload = self.payload or ([0, 0] + [0x80]*19)
+				self.out([self.drm] + payload[:21])
+
+class FakeBluetoothSocket(object):
+	def __init__(self, proto=0):
+		self.sock = None
+		
+	def connect(self, addr):
+		address, psm = addr
+		self.sock = remotes[address].attach(psm)
+		
+	def __getattr__(self, name):
+		return getattr(self.sock, name)
+
+try:
+	import bluetooth
+except ImportError:
+	bluetooth = types.ModuleType("bluetooth")
+	bluetooth.L2CAP = 0
+	bluetooth.BluetoothSocket = FakeBluetoothSocket
+	bluetooth.discover_devices = lambda duration=0, lookup_names=False: [(a, r.name) for a, r in remotes.items()]
+	sys.modules["bluetooth"] = bluetooth
+
+# Mapping file used by the glue tests and benchmarks
+EXAMPLE_MAPPING = os.path.join(SRC, "..", "mapping_examples", "generic_xbox360_mapping.map")
+
+class NullUInputDevice(object):
+	# Accepts the events of the glue and drops them
+	frame_len = 0
+	
+	def write_event(self, typ, code, value):
+		pass
+		
+	def send_event(self, ev):
+		pass
+		
+	def begin_frame(self):
+		pass
+		
+	def commit_frame(self, t=None):
+		pass
+
+class RecordingUInputDevice(NullUInputDevice):
+	# Keeps the events of each committed frame. Events are packed like
+	# libuinput does, so values it could not write fail here too
+	def __init__(self):
+		self.events = []
+		self.frames = []
+		self.frame_len = 0
+		
+	def write_event(self, typ, code, value):
+		import uinputdefs
+		uinputdefs.INPUT_EVENT.pack(0, 0, typ, code, value)
+		self.events.append((typ, code, value))
+		self.frame_len += 1
+		
+	def commit_frame(self, t=None):
+		self.frames.append(self.events)
+		self.events = []
+		self.frame_len = 0
+
+def createProController():
+	# WiiDevice decoding Pro Controller reports, without connection
+	import libwiimote
+	device = libwiimote.WiiDevice("00:00:00:00:00:00", "Nintendo RVL-CNT-01-UC", None, None, None, None)
+	device.state.device = libwiimote.WiiDevType.WIIMOTE_DEV_PRO_CONTROLLER
+	device.updateDecoders()
+	return device
+
+def createGlueDevice(profile, _mapping, device, uinputdev=None):
+	# UInputWiimote for an already decoded device, set up like
+	# initializeDevice does but without connection nor uinput device: its
+	# handlers can be called with payloads directly
+	import wiimote_uinput_glue
+	w = wiimote_uinput_glue.UInputWiimote.__new__(wiimote_uinput_glue.UInputWiimote)
+	w.emitLock = threading.Lock()
+	w.wiimotedev = device
+	w.profile = profile
+	w.mapping = _mapping
+	w.uinputdev = uinputdev if uinputdev != None else NullUInputDevice()
+	w.compile_active_mapping()
+	w.reset_output_state()
+	w.initialized = True
+	return w